@@ -18,6 +18,14 @@ public class CameraCapture : MonoBehaviour
     [Tooltip("The name of the camera in the scene")]
     public string cameraName = "SecurityAgent"; // The name of the camera in the scene
 
+    [Header("Upload Settings")]
+    [Tooltip("Send JPEG bytes to /send_frame instead of base64 PNG inside JSON to /send_vision")]
+    public bool sendBinaryFrames = true;
+
+    [Tooltip("JPEG quality used when sending binary frames (1-100)")]
+    [Range(1, 100)]
+    public int jpegQuality = 85;
+
     private Camera cameraToCapture;
 
     void Start()
@@ -49,28 +57,42 @@ public class CameraCapture : MonoBehaviour
             texture.ReadPixels(new Rect(0, 0, renderTexture.width, renderTexture.height), 0, 0);
             texture.Apply();
 
-            // Encode texture to PNG
-            byte[] imageBytes = texture.EncodeToPNG();
-            string base64Image = System.Convert.ToBase64String(imageBytes);
-
-            // Prepare JSON payload
-            string filename = $"{agentType}_vision.png";
-            ImagePayload payload = new ImagePayload
+            UnityWebRequest request;
+            if (sendBinaryFrames)
             {
-                image = base64Image,
-                filename = filename
-            };
-            string jsonPayload = JsonUtility.ToJson(payload);
-
-            // Construct the server URL with agentType
-            string url = $"{serverBaseUrl}/send_vision/{agentType}";
-
-            // Send image data to Flask server
-            UnityWebRequest request = new UnityWebRequest(url, "POST");
-            byte[] jsonToSend = new System.Text.UTF8Encoding().GetBytes(jsonPayload);
-            request.uploadHandler = new UploadHandlerRaw(jsonToSend);
-            request.downloadHandler = new DownloadHandlerBuffer();
-            request.SetRequestHeader("Content-Type", "application/json");
+                // Send the encoded frame as the raw request body
+                byte[] imageBytes = texture.EncodeToJPG(jpegQuality);
+                string url = $"{serverBaseUrl}/send_frame/{agentType}";
+                request = new UnityWebRequest(url, "POST");
+                request.uploadHandler = new UploadHandlerRaw(imageBytes);
+                request.downloadHandler = new DownloadHandlerBuffer();
+                request.SetRequestHeader("Content-Type", "image/jpeg");
+            }
+            else
+            {
+                // Encode texture to PNG
+                byte[] imageBytes = texture.EncodeToPNG();
+                string base64Image = System.Convert.ToBase64String(imageBytes);
+
+                // Prepare JSON payload
+                string filename = $"{agentType}_vision.png";
+                ImagePayload payload = new ImagePayload
+                {
+                    image = base64Image,
+                    filename = filename
+                };
+                string jsonPayload = JsonUtility.ToJson(payload);
+
+                // Construct the server URL with agentType
+                string url = $"{serverBaseUrl}/send_vision/{agentType}";
+
+                // Send image data to Flask server
+                request = new UnityWebRequest(url, "POST");
+                byte[] jsonToSend = new System.Text.UTF8Encoding().GetBytes(jsonPayload);
+                request.uploadHandler = new UploadHandlerRaw(jsonToSend);
+                request.downloadHandler = new DownloadHandlerBuffer();
+                request.SetRequestHeader("Content-Type", "application/json");
+            }
 
             yield return request.SendWebRequest();
 
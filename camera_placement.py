@@ -0,0 +1,196 @@
+"""Scores and optimizes camera layouts for the surveillance simulation.
+
+A layout is an array of camera cells. Layouts are scored in batches with
+NumPy over the whole grid:
+
+- coverage: fraction of cells seen by at least one camera,
+- overlap: fraction of cells seen by two or more cameras,
+- detection_time: expected steps until a random-walk robber, placed
+  uniformly at random and moving like Robber.move_randomly, is seen by a
+  camera, truncated at the run length.
+
+`optimize_layout` searches layouts with a genetic algorithm whose
+population is scored in parallel chunks. The best layout can be passed to
+SurveillanceModel (or the vectorized engine) as the `cameraPositions`
+parameter.
+
+Example:
+    python camera_placement.py --cameras 5 --generations 40 --output layout.json
+"""
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from dronerobbersimulationv3 import SurveillanceModel, parameters
+from vectorized_simulation import CAMERA_DETECTION_RANGE, ROBBER_DIRECTIONS
+
+
+def coverage_counts(layouts, world_size, detection_range=CAMERA_DETECTION_RANGE):
+    """
+    Number of cameras seeing each cell, for every layout.
+
+    Args:
+        layouts (array): Camera cells, shape (layouts, cameras, 2).
+        world_size (tuple): Grid size (width, height).
+        detection_range (int): Square range of each camera.
+
+    Returns:
+        np.ndarray: Counts, shape (layouts, width, height).
+    """
+    layouts = np.asarray(layouts, dtype=np.int64)
+    count, cameras, _ = layouts.shape
+    width, height = world_size
+    # 2D difference array: +1/-1 at the corners of every camera's square
+    low = np.clip(layouts - detection_range, 0, world_size)
+    high = np.clip(layouts + detection_range + 1, 0, world_size)
+    diff = np.zeros((count, width + 1, height + 1), dtype=np.int32)
+    index = np.repeat(np.arange(count), cameras)
+    x0, y0 = low[..., 0].ravel(), low[..., 1].ravel()
+    x1, y1 = high[..., 0].ravel(), high[..., 1].ravel()
+    np.add.at(diff, (index, x0, y0), 1)
+    np.add.at(diff, (index, x1, y0), -1)
+    np.add.at(diff, (index, x0, y1), -1)
+    np.add.at(diff, (index, x1, y1), 1)
+    return diff.cumsum(axis=1).cumsum(axis=2)[:, :width, :height]
+
+
+def shift(mass, axis, direction):
+    """Moves all mass one cell along an axis; mass at the border stays there."""
+    result = np.zeros_like(mass)
+    source = [slice(None)] * mass.ndim
+    target = [slice(None)] * mass.ndim
+    edge = [slice(None)] * mass.ndim
+    if direction > 0:
+        source[axis], target[axis], edge[axis] = slice(None, -1), slice(1, None), slice(-1, None)
+    else:
+        source[axis], target[axis], edge[axis] = slice(1, None), slice(None, -1), slice(0, 1)
+    result[tuple(target)] = mass[tuple(source)]
+    result[tuple(edge)] += mass[tuple(edge)]
+    return result
+
+
+def random_walk_step(mass):
+    """Spreads probability mass like one robber move: five directions, stopping at the border."""
+    result = np.zeros_like(mass)
+    for dx, dy in ROBBER_DIRECTIONS:
+        moved = mass
+        if dx:
+            moved = shift(moved, 1, dx)
+        if dy:
+            moved = shift(moved, 2, dy)
+        result += moved
+    return result / len(ROBBER_DIRECTIONS)
+
+
+def score_layouts(layouts, world_size, steps=60, detection_range=CAMERA_DETECTION_RANGE):
+    """
+    Scores a batch of layouts.
+
+    Returns:
+        dict: Arrays of coverage, overlap and detection_time, one value per layout.
+    """
+    counts = coverage_counts(layouts, world_size, detection_range)
+    covered = counts > 0
+    # Robbers are placed, then move, then the cameras look: the first
+    # detection can happen after one step
+    mass = np.full(counts.shape, 1.0 / (world_size[0] * world_size[1]))
+    detection_time = np.ones(len(counts))
+    for _ in range(1, steps):
+        mass = random_walk_step(mass)
+        mass[covered] = 0
+        detection_time += mass.sum(axis=(1, 2))
+    return {
+        'coverage': covered.mean(axis=(1, 2)),
+        'overlap': (counts > 1).mean(axis=(1, 2)),
+        'detection_time': detection_time,
+    }
+
+
+def fitness(scores, overlap_weight=0.0):
+    """Lower is better: expected detection time, optionally penalizing overlap."""
+    return scores['detection_time'] + overlap_weight * scores['overlap']
+
+
+def score_chunked(population, world_size, steps, executor=None, chunks=1):
+    """Scores a population, split into chunks across the executor if one is given."""
+    if executor is None:
+        return score_layouts(population, world_size, steps)
+    parts = np.array_split(population, chunks)
+    results = list(executor.map(score_layouts, parts, [world_size] * chunks, [steps] * chunks))
+    return {key: np.concatenate([result[key] for result in results]) for key in results[0]}
+
+
+def optimize_layout(camera_count, world_size=(100, 100), steps=60, population=64, generations=40,
+                    elite=8, mutation=6.0, overlap_weight=0.0, seed=None, initial=None, processes=1):
+    """
+    Searches for the camera layout with the lowest fitness using a genetic algorithm.
+
+    Each generation keeps the `elite` best layouts, and fills the rest of the
+    population with children that take each camera from one of two elite
+    parents and then move it by a Gaussian step of `mutation` cells.
+
+    Args:
+        camera_count (int): Number of cameras.
+        initial (list, optional): A layout included in the first generation,
+            e.g. the default triangle.
+        processes (int): Worker processes scoring chunks of each generation.
+
+    Returns:
+        tuple: (best layout as a list of (x, y), its scores).
+    """
+    rng = np.random.default_rng(seed)
+    upper = np.array(world_size) - 1
+    layouts = rng.integers(0, world_size, size=(population, camera_count, 2))
+    if initial is not None:
+        layouts[0] = initial
+    executor = ProcessPoolExecutor(processes) if processes > 1 else None
+    try:
+        scores = score_chunked(layouts, world_size, steps, executor, processes)
+        for _ in range(generations):
+            order = np.argsort(fitness(scores, overlap_weight), kind='stable')
+            parents = layouts[order[:elite]]
+            parent_scores = {key: value[order[:elite]] for key, value in scores.items()}
+            first = parents[rng.integers(elite, size=population - elite)]
+            second = parents[rng.integers(elite, size=population - elite)]
+            pick = rng.random((population - elite, camera_count, 1)) < 0.5
+            children = np.where(pick, first, second)
+            children = children + np.rint(rng.normal(0, mutation, children.shape)).astype(np.int64)
+            children = np.clip(children, 0, upper)
+            child_scores = score_chunked(children, world_size, steps, executor, processes)
+            layouts = np.concatenate([parents, children])
+            scores = {key: np.concatenate([parent_scores[key], child_scores[key]]) for key in scores}
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    best = int(np.argmin(fitness(scores, overlap_weight)))
+    return ([tuple(cell) for cell in layouts[best].tolist()],
+            {key: float(value[best]) for key, value in scores.items()})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search for a camera layout with low detection time.")
+    parser.add_argument('--cameras', type=int, default=parameters['cameraAgents'])
+    parser.add_argument('--generations', type=int, default=40)
+    parser.add_argument('--population', type=int, default=64)
+    parser.add_argument('--overlap-weight', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--output', help="JSON file for the cameraPositions parameter")
+    args = parser.parse_args()
+
+    world_size = tuple(parameters['worldSize'])
+    default = SurveillanceModel.calculate_camera_positions(args.cameras, world_size)
+    baseline = score_layouts([default], world_size, parameters['steps'])
+    print("Default triangle:", {key: round(float(value[0]), 4) for key, value in baseline.items()})
+    layout, scores = optimize_layout(
+        args.cameras, world_size, parameters['steps'], args.population, args.generations,
+        overlap_weight=args.overlap_weight, seed=args.seed, initial=default, processes=args.processes
+    )
+    print("Best layout:", layout, {key: round(value, 4) for key, value in scores.items()})
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'cameraPositions': layout}, f)
@@ -13,7 +13,6 @@ Original file is located at
 
 
 import agentpy as ap
-import pathfinding as pf        #use pathfinding algorithms for the agent's plan
 import matplotlib.pyplot as plt
 from owlready2 import *
 import itertools
@@ -21,6 +20,22 @@ import random
 import IPython
 import math
 import requests
+import threading
+import heapq
+import time
+import csv
+import json
+import gzip
+import pickle
+import os
+import queue
+import subprocess
+import zipfile
+from collections import deque, OrderedDict
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from scipy.spatial import cKDTree
+from concurrent.futures import Future, ThreadPoolExecutor
 
 """## 1. Defining Ontology"""
 
@@ -90,6 +105,16 @@ with onto:
         domain = [Entity]
         range = [str]
 
+    class observed_at(DataProperty, FunctionalProperty):
+        """Simulation step at which a Place was observed"""
+        domain = [Place]
+        range = [int]
+
+    class confidence(DataProperty, FunctionalProperty):
+        """Confidence of the observation of a Place"""
+        domain = [Place]
+        range = [float]
+
 # Save the ontology
 onto.save(file="drone_security_ontology.owl")
 
@@ -106,14 +131,16 @@ class DroneAgent(ap.Agent):
 
     def setup(self):
         """Initialize the drone's attributes."""
-        self.beliefs = None  # Current robber belief
+        self.beliefs = None  # Current robber Belief record
         self.intention = None  # Current goal
-        self.plan_steps = []  # Steps to achieve the goal
+        self.plan_steps = deque()  # Steps to achieve the goal
         self.intention_succeeded = True  # Whether the current intention is complete
         self.patrol_mode = False  # Whether the drone is patrolling
         self.agent_type = 0  # For visualization
         self.landing_position = None  # The fixed landing station
         self.alert_sent = False  # Flag to prevent multiple alerts
+        self.camera_alert = None  # Camera event being verified
+        self.alert_target = None  # Location the current plan was made for
 
     def send_alert_to_security(self):
         """Send an alert to the SecurityPersonnelAgent."""
@@ -123,114 +150,80 @@ class DroneAgent(ap.Agent):
                 'drone': self,
                 'location': self.model.grid.positions[self]
             }
-            self.model.alerts.append(alert)
+            self.model.alerts.publish(alert)
             self.alert_sent = True
-            print("Security personnel alerted.")
-            print("Alarm is alerted.")
+            self.model.trace.record(self.model.t, 'security_alerted', self.id)
             # Removed the simulation end to allow security personnel to respond
             # self.model.end()
 
-    def process_camera_alerts(self):
-        """Processes alerts from cameras and verifies the robber's presence."""
-        for alert in self.model.alerts[:]:  # Iterate over a copy to allow safe removal
-            if 'type' in alert and alert['type'] == 'camera_signal':  # Check if 'type' exists
-                print(f"Drone received camera alert: Robber at {alert['location']}.")
-                self.intention = 'verify_camera_alert'
-                self.plan_steps = self.plan_to(alert['location'])
-                self.model.alerts.remove(alert)
+    def assign_alert(self, alert):
+        """Takes a camera alert assigned by the model's dispatcher and plans to verify it."""
+        self.model.trace.record(self.model.t, 'camera_alert_received', self.id, alert['location'])
+        if self.camera_alert is not None and self.camera_alert is not alert:
+            self.model.alerts.close(self.camera_alert)
+        self.camera_alert = alert
+        self.intention = 'verify_camera_alert'
+        self.alert_target = alert['location']
+        self.plan_steps = self.plan_to(alert['location'])
 
     def plan_to(self, target_position):
         """Creates a plan (sequence of movements) to a specified target."""
         current_position = self.model.grid.positions[self]
-        dx = target_position[0] - current_position[0]
-        dy = target_position[1] - current_position[1]
-
-        plan = []
-
-        # Create combined steps until one of the axes reaches the target
-        while dx != 0 and dy != 0:
-            step_x = 1 if dx > 0 else -1
-            step_y = 1 if dy > 0 else -1
-            plan.append((step_x, step_y))
-            dx -= step_x
-            dy -= step_y
-
-        # Add remaining steps in x direction if necessary
-        while dx != 0:
-            step_x = 1 if dx > 0 else -1
-            plan.append((step_x, 0))
-            dx -= step_x
-
-        # Add remaining steps in y direction if necessary
-        while dy != 0:
-            step_y = 1 if dy > 0 else -1
-            plan.append((0, step_y))
-            dy -= step_y
-
-        return plan
+        return self.model.planner.plan(current_position, target_position)
 
     def land(self):
         """Simulates the drone landing at the station."""
         if self.model.grid.positions[self] != self.landing_position:
-            print(f"Drone returning to its landing position at {self.landing_position}.")
+            self.model.trace.record(self.model.t, 'returning', self.id, self.landing_position)
             self.plan_steps = self.plan_to(self.landing_position)
         else:
             self.patrol_mode = False
-            print(f"Drone has landed safely at {self.landing_position}.")
+            self.model.trace.record(self.model.t, 'landed', self.id, self.landing_position)
 
     def takeoff(self):
         """Simulates the drone taking off from the landing station."""
         self.patrol_mode = True
-        print(f"Drone is taking off from {self.landing_position} and starting patrol.")
+        self.model.trace.record(self.model.t, 'takeoff', self.id, self.landing_position)
 
     def see(self, environment):
         """Perception: Detects the robber within range."""
         detection_range = 10
         detected_robber = next(
-            (entity for entity in environment.neighbors(self, distance=detection_range)
-             if isinstance(entity, Robber)),
+            iter(environment.neighbors_of_type(self, Robber, distance=detection_range)),
             None
         )
         return detected_robber
 
     def brf(self, detected_robber):
         """Belief Revision Function: Updates the belief system based on perceptions."""
-        self.destroy_previous_beliefs()
+        self.beliefs = None
         if detected_robber:
             current_position = self.model.grid.positions[detected_robber]
-            detected_robber.is_in_place = [Place(at_position=str(current_position))]
-            self.beliefs = detected_robber
-
-    def destroy_previous_beliefs(self):
-        """Clears the drone's current belief system."""
-        if self.beliefs:
-            if hasattr(self.beliefs, 'is_in_place') and self.beliefs.is_in_place:
-                destroy_entity(self.beliefs.is_in_place[0])
-            destroy_entity(self.beliefs)
-            self.beliefs = None
+            self.beliefs = self.model.beliefs.revise(self, detected_robber, current_position)
 
     def execute_plan(self):
         """Executes the current plan by taking one step at a time."""
         if self.plan_steps:
-            next_step = self.plan_steps.pop(0)
+            next_step = self.plan_steps.popleft()
             self.model.grid.move_by(self, next_step)
-            print(f"Drone moved to {self.model.grid.positions[self]}.")
+            self.model.trace.record(self.model.t, 'moved', self.id, self.model.grid.positions[self])
         else:
             self.intention_succeeded = True
-            print("Drone has completed its current plan.")
+            self.model.trace.record(self.model.t, 'plan_completed', self.id)
             self.send_alert_to_security()
 
     def take_random_step(self):
         """Makes small random steps to patrol."""
         directions = [(1, 0), (-1, 0), (0, 1), (0, -1)]
-        step = random.choice(directions)
+        step = directions[self.model.nprandom.integers(len(directions))]
         new_position = (
             self.model.grid.positions[self][0] + step[0],
             self.model.grid.positions[self][1] + step[1]
         )
-        if 0 <= new_position[0] < self.model.p.worldSize[0] and 0 <= new_position[1] < self.model.p.worldSize[1]:
+        if (0 <= new_position[0] < self.model.p.worldSize[0] and 0 <= new_position[1] < self.model.p.worldSize[1]
+                and not self.model.planner.is_blocked(new_position)):
             self.model.grid.move_by(self, step)
-            print(f"Drone moved to {new_position}.")
+            self.model.trace.record(self.model.t, 'moved', self.id, new_position)
 
     def step(self):
         """The main drone logic for a single simulation step."""
@@ -238,15 +231,21 @@ class DroneAgent(ap.Agent):
             return  # Skip processing if alert has been sent
 
         position = self.model.grid.positions[self]
-        send_position('Drone', position)
+        self.model.telemetry.send('Drone', self.id, position)
+        self.model.trace.record(self.model.t, 'position', self.id, position)
 
         # Step 1: Take off if not patrolling
         if not self.patrol_mode:
             self.takeoff()
 
-        # Step 2: Process camera alerts
-        self.process_camera_alerts()
+        # Step 2: Verify the camera alert assigned by the dispatcher
         if self.intention == 'verify_camera_alert':
+            # Cameras update the event in place; only re-plan when the robber moved
+            if self.camera_alert is not None and self.camera_alert['location'] != self.alert_target:
+                self.plan_steps = self.model.planner.repair(
+                    self.model.grid.positions[self], self.plan_steps,
+                    self.alert_target, self.camera_alert['location'])
+                self.alert_target = self.camera_alert['location']
             self.execute_plan()
             return
 
@@ -255,17 +254,20 @@ class DroneAgent(ap.Agent):
         if detected_robber:
             self.brf(detected_robber)
             self.send_alert_to_security()
-            self.plan_steps = self.plan_to(eval(self.beliefs.is_in_place[0].at_position))
+            self.plan_steps = self.plan_to(self.beliefs.position)
             self.execute_plan()
             return
 
         # Step 4: Check if the drone is at the same position as the robber
-        if self.beliefs and self.model.grid.positions[self] == eval(self.beliefs.is_in_place[0].at_position):
+        if self.beliefs and self.model.grid.positions[self] == self.beliefs.position:
             robber_position = self.model.grid.positions[self]
-            print(f"Drone captured the robber at {robber_position}!")
+            robber = self.beliefs.agent
+            if robber in self.model.robber:  # Security may have removed it already
+                self.model.trace.record(self.model.t, 'captured', self.id, robber_position)
+                self.model.trace.record(self.model.t, 'removed', robber.id, robber_position)
+                self.model.grid.remove_agents(robber)  # Remove the robber
+                self.model.robber.remove(robber)  # Remove from the model's robber list
             self.send_alert_to_security()  # Alert when capturing
-            self.model.grid.remove_agents(self.beliefs)  # Remove the robber
-            self.model.robber.remove(self.beliefs)  # Remove from the model's robber list
             self.beliefs = None  # Clear belief about the robber
             self.plan_steps = self.plan_to(self.landing_position)  # Plan to return to base
             self.execute_plan()
@@ -290,10 +292,12 @@ class DroneAgent(ap.Agent):
         """
         if command == "alert_resolved":
             self.alert_sent = False
-            print("Drone has received 'alert_resolved' command and is ready for new tasks.")
+            self.model.trace.record(self.model.t, 'alert_resolved', self.id)
             # Optional: Reset intentions or perform other state updates as needed
+            self.model.alerts.close(self.camera_alert)
+            self.camera_alert = None
             self.intention = None
-            self.plan_steps = []
+            self.plan_steps = deque()
             self.intention_succeeded = True
             self.patrol_mode = True  # Resume patrol mode if appropriate
 
@@ -308,38 +312,34 @@ class CameraAgent(ap.Agent):
         self.detection_range = 18  # Larger range than the drone
         self.alerts_sent = 0  # Tracks the number of alerts sent
         self.agent_type = 1  # Unique type identifier for visualization
+        self.coverage_index = None  # Column of the camera in the model's CoverageMap
 
 
     def detect_robber(self):
         """Detects the robber within the camera's perception range."""
-        # Check for suspicious objects via computational vision with 20% probability
-        if random.random() < 0.4:
-            try:
-                response = requests.get(f"http://localhost:5000/check_image/{self.name}")
-                data = response.json()
-                sus_detected = data.get("sus_object_detected", False)
-                if sus_detected:
-                    self.alerts_sent += 1  # Example action based on detection
-            except requests.RequestException:
-                pass
-
-        # Always use neighbors() to find all agents within the specified range
-        detected_robber = next(
-            (entity for entity in self.model.grid.neighbors(self, distance=self.detection_range)
-            if isinstance(entity, Robber)),
-            None  # Default to None if no robber is detected
-        )
-        return detected_robber
+        # Apply the computational vision result requested on the previous step
+        if self.model.vision.collect(self.name):
+            self.alerts_sent += 1  # Example action based on detection
+
+        # Check for suspicious objects via computational vision with 40% probability,
+        # running concurrently with the other cameras' checks
+        if self.model.nprandom.random() < 0.4:
+            self.model.vision.request(self.name)
+
+        # Look up the robbers in the precomputed coverage of this camera
+        return self.model.camera_detections()[self.coverage_index]
 
     def send_alert(self, robber):
         """Sends an alert to the drone with the robber's location."""
         robber_position = self.model.grid.positions[robber]
         alert = {'type': 'camera_signal',
                  'camera': self.name,  # Use camera name
+                 'robber': robber,  # Identity used to coalesce repeated detections
                  'location': robber_position}
-        self.model.alerts.append(alert)  # Add the alert to the model's alert system
+        self.model.alerts.publish(alert)  # Add the alert to the model's alert system
         self.alerts_sent += 1
-        print(f"{self.name} at {self.model.grid.positions[self]} sent an alert: Robber detected at {robber_position}")
+        self.model.trace.record(self.model.t, 'camera_alert', self.id, robber_position,
+                                f"{self.name} at {self.model.grid.positions[self]}")
 
     def step(self):
         if not self.model.running:
@@ -363,12 +363,13 @@ class Robber(ap.Agent):
     def move_randomly(self):
         """Moves the robber randomly within the grid."""
         directions = [(1, 0), (-1, 0), (0, 1), (0, -1), (0, 0)]  # Including staying in place
-        step = random.choice(directions)
+        step = directions[self.model.nprandom.integers(len(directions))]
         self.model.grid.move_by(self, step)
 
     def step(self):
         position = self.model.grid.positions[self]
-        send_position('Robber', position)
+        self.model.telemetry.send('Robber', self.id, position)
+        self.model.trace.record(self.model.t, 'position', self.id, position)
         """Defines the robber's behavior per simulation step."""
         self.move_randomly()
 
@@ -391,7 +392,7 @@ class SecurityPersonnelAgent(ap.Agent):
             drone (DroneAgent): The drone requesting assistance.
             robber_position (tuple): The location of the detected robber.
         """
-        print(f"Security personnel are communicating with the drone at {robber_position}.")
+        self.model.trace.record(self.model.t, 'security_contact', self.id, robber_position)
         self.in_communication = True
         self.confirm_robber(drone, robber_position)
 
@@ -403,13 +404,13 @@ class SecurityPersonnelAgent(ap.Agent):
             drone (DroneAgent): The drone currently under simulated control.
             robber_position (tuple): The location of the detected robber.
         """
-        print(f"Robber confirmed at {robber_position}. Issuing a general alarm.")
+        self.model.trace.record(self.model.t, 'robber_confirmed', self.id, robber_position)
 
         self.simulate_general_alarm(drone, robber_position)
 
     def simulate_general_alarm(self, drone, robber_position):
         """Simulates issuing a general alarm and removes the confirmed robber."""
-        print("General alarm issued. Security personnel have resolved the alert.")
+        self.model.trace.record(self.model.t, 'alarm_issued', self.id)
         robber_to_remove = next(
             (robber for robber in self.model.robber if self.model.grid.positions[robber] == robber_position),
             None
@@ -417,9 +418,9 @@ class SecurityPersonnelAgent(ap.Agent):
         if robber_to_remove:
             self.model.grid.remove_agents(robber_to_remove)
             self.model.robber.remove(robber_to_remove)
-            print(f"Robber at {robber_position} has been removed from the grid.")
+            self.model.trace.record(self.model.t, 'robber_removed', robber_to_remove.id, robber_position)
         else:
-            print(f"No robber found at {robber_position} to remove.")
+            self.model.trace.record(self.model.t, 'no_robber', self.id, robber_position)
 
         self.in_communication = False
         self.alert_handled = True
@@ -429,13 +430,16 @@ class SecurityPersonnelAgent(ap.Agent):
                     'position': robber_position
                 }        
         try:
+            start = time.perf_counter_ns()
             response = requests.post(url, json=payload)
+            if self.model.profiler is not None:
+                self.model.profiler.record_call('/alert_alarm', time.perf_counter_ns() - start)
             if response.status_code == 200:
-                print("Alarm alert sent successfully.")
+                self.model.trace.record(self.model.t, 'alarm_sent', self.id)
             else:
-                print("Failed to send alarm alert.")
+                self.model.trace.record(self.model.t, 'alarm_failed', self.id)
         except requests.exceptions.ConnectionError:
-            print("Failed to connect to the Flask server.")
+            self.model.trace.record(self.model.t, 'server_unreachable', self.id)
         # Find the robber at the specified position
        
         drone.receive_command("alert_resolved")  # Simulated command to drone
@@ -447,32 +451,158 @@ class SecurityPersonnelAgent(ap.Agent):
         """
         if not self.in_communication and not self.alert_handled:
             # Check if the drone has sent a signal for help
-            for alert in self.model.alerts[:]:
-                if 'type' not in alert:
-                    print(f"Malformed alert: {alert}")
-                    self.model.alerts.remove(alert)  # Remove invalid alerts
-                    continue
-
-                if alert['type'] == 'drone_signal':
-                    self.respond_to_drone_signal(alert['drone'], alert['location'])
-                    self.model.alerts.remove(alert)  # Remove the alert after handling
+            for alert in self.model.alerts.drain('drone_signal'):
+                self.respond_to_drone_signal(alert['drone'], alert['location'])
 
 """## Additional functions"""
 
-def send_position(agent_type, position):
-    url = 'http://localhost:5000/update_position'
-    payload = {
-        'agent_type': agent_type,
-        'position': position
-    }
-    try:
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            print(f"{agent_type} position sent successfully.")
-        else:
-            print(f"Failed to send {agent_type} position.")
-    except requests.exceptions.ConnectionError:
-        print("Failed to connect to the Flask server.")
+class TelemetryClient:
+    """
+    Sends agent positions to the Flask server without blocking the simulation.
+
+    Updates are coalesced per agent in an outbox and posted by a background
+    worker as one batched request per step over a keep-alive session. If the
+    worker falls behind, newer updates overwrite stale ones for the same agent.
+    """
+
+    def __init__(self, url='http://localhost:5000/update_positions', timeout=2.0):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount('http://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.outbox = {}  # (agent_type, agent_id) -> position update
+        self.profiler = None  # Set by the model when profiling
+        self.step = 0  # Latest step handed to the worker
+        self.ready = False  # Whether the outbox holds a completed step
+        self.sending = False
+        self.connected = True
+        self.closed = False
+        self.condition = threading.Condition()
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+    def send(self, agent_type, agent_id, position):
+        """Queue the position of one agent for the current step."""
+        with self.condition:
+            self.outbox[(agent_type, agent_id)] = {
+                'agent_type': agent_type,
+                'agent_id': agent_id,
+                'position': list(position)
+            }
+
+    def end_step(self, step):
+        """Hand the updates queued during `step` to the worker."""
+        with self.condition:
+            self.step = step
+            self.ready = bool(self.outbox)
+            self.condition.notify()
+
+    def flush(self, timeout=5.0):
+        """Wait until every queued update has been sent."""
+        with self.condition:
+            self.ready = bool(self.outbox)
+            self.condition.notify()
+            self.condition.wait_for(lambda: not self.ready and not self.sending, timeout=timeout)
+
+    def close(self, timeout=5.0):
+        """Sends the queued updates, then stops the worker and closes the session."""
+        self.flush(timeout)
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.worker.join(timeout)
+        self.session.close()
+
+    def run(self):
+        """Worker loop: post each completed batch as a single request."""
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.ready or self.closed)
+                if not self.ready:
+                    return  # Closed with nothing left to send
+                payload = {'step': self.step, 'positions': list(self.outbox.values())}
+                self.outbox = {}
+                self.ready = False
+                self.sending = True
+            self.post(payload)
+            with self.condition:
+                self.sending = False
+                self.condition.notify_all()
+
+    def post(self, payload):
+        start = time.perf_counter_ns()
+        try:
+            response = self.session.post(self.url, json=payload, timeout=self.timeout)
+            if response.status_code != 200:
+                print(f"Failed to send positions for step {payload['step']}.")
+            elif not self.connected:
+                print("Reconnected to the Flask server.")
+            self.connected = True
+        except requests.exceptions.RequestException:
+            if self.connected:
+                print("Failed to connect to the Flask server.")
+            self.connected = False
+        if self.profiler is not None:
+            self.profiler.record_call('/update_positions', time.perf_counter_ns() - start)
+
+class VisionChecker:
+    """
+    Runs the cameras' /check_image requests concurrently on a thread pool.
+
+    A request issued during step t is collected by the same camera at step
+    t + 1, so the checks of all cameras overlap with each other and with the
+    rest of the step instead of running one after another.
+    """
+
+    def __init__(self, base_url='http://localhost:5000', workers=8, timeout=2.0):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount('http://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers))
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='vision')
+        self.pending = {}  # camera name -> Future of its in-flight check
+        self.profiler = None  # Set by the model when profiling
+
+    def check(self, camera_name):
+        """Asks the Flask server whether the camera's latest frame shows a suspect."""
+        start = time.perf_counter_ns()
+        try:
+            response = self.session.get(f"{self.base_url}/check_image/{camera_name}", timeout=self.timeout)
+            return response.json().get("sus_object_detected", False)
+        except (requests.RequestException, ValueError):
+            return False
+        finally:
+            if self.profiler is not None:
+                self.profiler.record_call('/check_image', time.perf_counter_ns() - start)
+
+    def request(self, camera_name):
+        """Starts a check for the camera unless one is still in flight."""
+        if camera_name not in self.pending:
+            self.pending[camera_name] = self.executor.submit(self.check, camera_name)
+
+    def collect(self, camera_name):
+        """Returns the result of the camera's previous check (False if there is none)."""
+        future = self.pending.pop(camera_name, None)
+        if future is None:
+            return False
+        return future.result()
+
+    def close(self):
+        """Waits for the checks in flight, then stops the thread pool and closes the session."""
+        self.executor.shutdown()
+        self.session.close()
+
+    def results(self):
+        """Waits for the checks in flight and returns their results by camera name."""
+        return {camera_name: future.result() for camera_name, future in self.pending.items()}
+
+    def restore(self, results):
+        """Makes the given results the checks in flight, to be collected next step."""
+        self.pending = {}
+        for camera_name, result in results.items():
+            future = Future()
+            future.set_result(result)
+            self.pending[camera_name] = future
 
 """Destroy Beliefs"""
 
@@ -500,40 +630,1467 @@ def move_by(agent, step):
     if agent.model.grid.is_within_bounds(new_position):
         agent.model.grid.move_to(agent, new_position)
 
+"""## Event trace
+
+Agents record what they do as fixed-layout events instead of printing.
+Console output is a filter over the events, and the trace can be saved to a
+compact binary file and replayed with trace_replay.py.
+"""
+
+# Event kinds, in code order, with the console message of each (None: not
+# printed). Messages are formatted with the event's x, y and text payload.
+EVENT_KINDS = {
+    'world': None,  # x, y: world size
+    'placed': None,  # Initial position; text: agent type (Drone, Camera, Robber, Security)
+    'robber_placed': "{text} placed at position: ({x}, {y})",
+    'position': None,  # Position of a moving agent at the start of its step
+    'removed': None,  # A robber removed by a drone capture
+    'security_alerted': "Security personnel alerted.\nAlarm is alerted.",
+    'camera_alert_received': "Drone received camera alert: Robber at ({x}, {y}).",
+    'returning': "Drone returning to its landing position at ({x}, {y}).",
+    'landed': "Drone has landed safely at ({x}, {y}).",
+    'takeoff': "Drone is taking off from ({x}, {y}) and starting patrol.",
+    'moved': "Drone moved to ({x}, {y}).",
+    'plan_completed': "Drone has completed its current plan.",
+    'captured': "Drone captured the robber at ({x}, {y})!",
+    'alert_resolved': "Drone has received 'alert_resolved' command and is ready for new tasks.",
+    'camera_alert': "{text} sent an alert: Robber detected at ({x}, {y})",
+    'security_contact': "Security personnel are communicating with the drone at ({x}, {y}).",
+    'robber_confirmed': "Robber confirmed at ({x}, {y}). Issuing a general alarm.",
+    'alarm_issued': "General alarm issued. Security personnel have resolved the alert.",
+    'robber_removed': "Robber at ({x}, {y}) has been removed from the grid.",
+    'no_robber': "No robber found at ({x}, {y}) to remove.",
+    'alarm_sent': "Alarm alert sent successfully.",
+    'alarm_failed': "Failed to send alarm alert.",
+    'server_unreachable': "Failed to connect to the Flask server.",
+}
+EVENT_CODES = {kind: code for code, kind in enumerate(EVENT_KINDS)}
+
+# One trace record; payload is an index into the trace's payload strings, or -1
+EVENT_DTYPE = np.dtype([
+    ('step', '<u4'), ('agent', '<i4'), ('kind', '<u2'), ('x', '<i4'), ('y', '<i4'), ('payload', '<i4')
+])
+TRACE_MAGIC = b'DRTRACE1'
+
+class EventTrace:
+    """
+    Records events in a preallocated NumPy ring buffer.
+
+    With a `path`, a full buffer is appended to the binary trace file in one
+    write (payload strings go to `<path>.payloads`, one JSON string per
+    line); without one, the oldest events and their payloads are overwritten,
+    so memory stays fixed. `verbose` prints
+    the message of every event (True), of the listed kinds, or none (False).
+    """
+
+    def __init__(self, path=None, capacity=65536, verbose=True):
+        self.path = path
+        self.buffer = np.zeros(capacity, dtype=EVENT_DTYPE)
+        self.length = 0  # Records in the buffer
+        self.total = 0  # Records ever recorded
+        # Payload strings not yet written, or a ring of the live records' payloads
+        self.payloads = [] if path is not None else [None] * capacity
+        self.payload_count = 0
+        if verbose is True:
+            verbose = [kind for kind, message in EVENT_KINDS.items() if message]
+        self.verbose = {EVENT_CODES[kind] for kind in verbose or ()}
+        if path is not None:
+            with open(path, 'wb') as f:
+                f.write(TRACE_MAGIC)
+            open(f"{path}.payloads", 'w').close()
+
+    def record(self, step, kind, agent=-1, position=(0, 0), text=None):
+        """Appends one event; `text` is an optional payload string."""
+        code = EVENT_CODES[kind]
+        if self.length == len(self.buffer) and self.path is not None:
+            self.flush()
+        payload = -1
+        if text is not None:
+            payload = self.payload_count
+            if self.path is not None:
+                self.payloads.append(text)
+            else:
+                # A record holds at most one payload, so the ring never drops a live one
+                self.payloads[payload % len(self.payloads)] = text
+            self.payload_count += 1
+        index = self.length if self.path is not None else self.total % len(self.buffer)
+        self.buffer[index] = (step, agent, code, position[0], position[1], payload)
+        self.length = min(self.length + 1, len(self.buffer))
+        self.total += 1
+        if code in self.verbose:
+            print(format_event(kind, position, text))
+
+    def flush(self):
+        """Appends the buffered records and payloads to the trace file."""
+        if self.path is None:
+            return
+        with open(self.path, 'ab') as f:
+            f.write(self.buffer[:self.length].tobytes())
+        with open(f"{self.path}.payloads", 'a') as f:
+            f.writelines(json.dumps(text) + "\n" for text in self.payloads)
+        self.length = 0
+        self.payloads = []
+
+    def payload(self, index):
+        """The payload string of a record still in memory."""
+        if self.path is None:
+            return self.payloads[index % len(self.payloads)]
+        return self.payloads[index - (self.payload_count - len(self.payloads))]
+
+    def records(self):
+        """The events still in memory, oldest first."""
+        if self.path is None and self.total > len(self.buffer):
+            return np.roll(self.buffer, -(self.total % len(self.buffer)))
+        return self.buffer[:self.length].copy()
+
+def format_event(kind, position, text=None):
+    """The console message of an event."""
+    return EVENT_KINDS[kind].format(x=position[0], y=position[1], text=text or '')
+
+def read_trace(path):
+    """Loads a trace file written by EventTrace: (records, payload strings)."""
+    with open(path, 'rb') as f:
+        if f.read(len(TRACE_MAGIC)) != TRACE_MAGIC:
+            raise ValueError(f"{path} is not an event trace")
+        records = np.frombuffer(f.read(), dtype=EVENT_DTYPE)
+    with open(f"{path}.payloads") as f:
+        payloads = [json.loads(line) for line in f]
+    return records, payloads
+
+"""## Profiling
+
+Optional timing of the step phases and of the HTTP calls to the Flask
+server, enabled with the 'profile' parameter.
+"""
+
+class Profiler:
+    """
+    Times step phases and outbound calls with the monotonic nanosecond clock.
+
+    Each step gets one trace row with the duration of every phase and the
+    count and total time of every call type completed during it. `write`
+    saves the trace as CSV and a JSON summary with log2 histograms.
+    """
+
+    def __init__(self, output='profile'):
+        self.output = output
+        self.rows = []  # One dict per step
+        self.samples = {}  # phase or call name -> durations in ns
+        self.calls = {}  # call name -> [count, total ns] for the current step
+        self.lock = threading.Lock()  # Calls are recorded from worker threads
+
+    def run_step(self, step, phases):
+        """Runs the phases of one step, timing each of them."""
+        row = {'step': step}
+        clock = time.perf_counter_ns
+        for name, phase in phases.items():
+            start = clock()
+            phase()
+            row[name] = clock() - start
+            self.samples.setdefault(name, []).append(row[name])
+        row['total'] = sum(row[name] for name in phases)
+        self.samples.setdefault('total', []).append(row['total'])
+        with self.lock:
+            for name, (count, total) in self.calls.items():
+                row[f"{name} calls"] = count
+                row[f"{name} ns"] = total
+            self.calls = {}
+        self.rows.append(row)
+
+    def record_call(self, name, duration):
+        """Records one outbound call of `duration` ns."""
+        with self.lock:
+            self.samples.setdefault(name, []).append(duration)
+            stats = self.calls.setdefault(name, [0, 0])
+            stats[0] += 1
+            stats[1] += duration
+
+    @staticmethod
+    def histogram(durations):
+        """Counts per power-of-two bucket of microseconds, keyed by the bucket's upper bound."""
+        counts = {}
+        for duration in durations:
+            bound = 1 << max(duration // 1000, 0).bit_length()
+            counts[bound] = counts.get(bound, 0) + 1
+        return {f"<{bound}us": counts[bound] for bound in sorted(counts)}
+
+    def summary(self):
+        """Count, total, mean, p50, p95, max (in ms) and histogram per phase and call."""
+        with self.lock:
+            samples = {name: sorted(values) for name, values in self.samples.items()}
+        summary = {}
+        for name, values in samples.items():
+            summary[name] = {
+                'count': len(values),
+                'total_ms': sum(values) / 1e6,
+                'mean_ms': sum(values) / len(values) / 1e6,
+                'p50_ms': values[len(values) // 2] / 1e6,
+                'p95_ms': values[min(int(len(values) * 0.95), len(values) - 1)] / 1e6,
+                'max_ms': values[-1] / 1e6,
+                'histogram': self.histogram(values),
+            }
+        return summary
+
+    def write(self):
+        """Writes <output>_trace.csv and <output>_summary.json and returns a text report."""
+        columns = []
+        for row in self.rows:
+            columns.extend(key for key in row if key not in columns)
+        with open(f"{self.output}_trace.csv", 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=columns, restval=0)
+            writer.writeheader()
+            writer.writerows(self.rows)
+        summary = self.summary()
+        with open(f"{self.output}_summary.json", 'w') as f:
+            json.dump(summary, f, indent=2)
+        lines = [f"{'':18}{'count':>8}{'mean ms':>10}{'p95 ms':>10}{'max ms':>10}{'total ms':>11}"]
+        for name, stats in summary.items():
+            lines.append(f"{name:18}{stats['count']:>8}{stats['mean_ms']:>10.3f}{stats['p95_ms']:>10.3f}"
+                         f"{stats['max_ms']:>10.3f}{stats['total_ms']:>11.1f}")
+        return "\n".join(lines)
+
+"""## Path planning
+
+A* over an 8-connected grid with no-fly cells, a path cache and incremental
+repair for targets that moved a few cells.
+"""
+
+MOVES = [(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1)]
+
+class PathPlanner:
+    """
+    Plans drone paths as deques of (dx, dy) steps.
+
+    When the straight diagonal-then-axis path is free of obstacles it is used
+    as is (it is already a shortest path on this grid); otherwise A* searches
+    around the no-fly cells. Paths are cached by (start, goal, map version),
+    so repeated trips such as returning to the landing station cost nothing.
+    """
+
+    def __init__(self, shape, blocked=None, cache_size=256, repair_radius=3, max_expansions=200_000):
+        self.shape = tuple(shape)
+        self.blocked = set(blocked or ())  # No-fly cells
+        self.version = 0  # Bumped on every obstacle change, invalidating cached paths
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.repair_radius = repair_radius
+        self.max_expansions = max_expansions
+        self.stats = {'cache_hits': 0, 'straight': 0, 'searches': 0, 'repairs': 0, 'unreachable': 0}
+
+    @staticmethod
+    def no_fly_cells(zones):
+        """Expands inclusive (x1, y1, x2, y2) rectangles into a set of cells."""
+        return {(x, y) for x1, y1, x2, y2 in zones for x in range(x1, x2 + 1) for y in range(y1, y2 + 1)}
+
+    def set_blocked(self, cells, blocked=True):
+        """Adds (or removes) no-fly cells."""
+        if blocked:
+            self.blocked.update(cells)
+        else:
+            self.blocked.difference_update(cells)
+        self.version += 1
+
+    def is_blocked(self, position):
+        return tuple(position) in self.blocked
+
+    def in_bounds(self, position):
+        return 0 <= position[0] < self.shape[0] and 0 <= position[1] < self.shape[1]
+
+    @staticmethod
+    def straight_steps(start, goal):
+        """Diagonal steps until one axis matches, then axis steps."""
+        dx = goal[0] - start[0]
+        dy = goal[1] - start[1]
+        step_x = (dx > 0) - (dx < 0)
+        step_y = (dy > 0) - (dy < 0)
+        diagonal = min(abs(dx), abs(dy))
+        steps = [(step_x, step_y)] * diagonal
+        steps += [(step_x, 0)] * (abs(dx) - diagonal)
+        steps += [(0, step_y)] * (abs(dy) - diagonal)
+        return steps
+
+    def path_is_free(self, start, steps):
+        if not self.blocked:
+            return True
+        x, y = start
+        for dx, dy in steps:
+            x += dx
+            y += dy
+            if (x, y) in self.blocked:
+                return False
+        return True
+
+    def search(self, start, goal):
+        """A* with the Chebyshev heuristic. Returns a list of steps, or None if unreachable."""
+        if start == goal:
+            return []
+        if goal in self.blocked or not self.in_bounds(goal):
+            return None
+
+        def heuristic(cell):
+            return max(abs(goal[0] - cell[0]), abs(goal[1] - cell[1]))
+
+        came_from = {start: None}
+        cost = {start: 0}
+        frontier = [(heuristic(start), 0, start)]
+        expansions = 0
+        while frontier and expansions < self.max_expansions:
+            _, g, cell = heapq.heappop(frontier)
+            if cell == goal:
+                steps = []
+                while came_from[cell] is not None:
+                    previous = came_from[cell]
+                    steps.append((cell[0] - previous[0], cell[1] - previous[1]))
+                    cell = previous
+                steps.reverse()
+                return steps
+            if g > cost[cell]:
+                continue  # Stale heap entry
+            expansions += 1
+            for dx, dy in MOVES:
+                neighbor = (cell[0] + dx, cell[1] + dy)
+                if not self.in_bounds(neighbor) or neighbor in self.blocked:
+                    continue
+                if g + 1 < cost.get(neighbor, g + 2):
+                    cost[neighbor] = g + 1
+                    came_from[neighbor] = cell
+                    heapq.heappush(frontier, (g + 1 + heuristic(neighbor), g + 1, neighbor))
+        return None
+
+    def plan(self, start, goal):
+        """Returns a new deque of steps from start to goal (empty if unreachable)."""
+        start, goal = tuple(start), tuple(goal)
+        key = (start, goal, self.version)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.cache.move_to_end(key)
+            self.stats['cache_hits'] += 1
+            return deque(cached)
+
+        steps = self.straight_steps(start, goal)
+        if self.path_is_free(start, steps):
+            self.stats['straight'] += 1
+        else:
+            self.stats['searches'] += 1
+            steps = self.search(start, goal)
+            if steps is None:
+                self.stats['unreachable'] += 1
+                steps = []
+
+        self.cache[key] = tuple(steps)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return deque(steps)
+
+    def repair(self, position, plan_steps, old_goal, new_goal):
+        """
+        Adapts a plan to a target that moved from `old_goal` to `new_goal`.
+
+        If the straight path to the new goal is free it is used, as a fresh
+        plan would. Otherwise, when the goal moved at most `repair_radius`
+        cells, the current path is kept up to the cell closest to the new goal
+        and only the short remainder is searched again.
+        """
+        position, new_goal = tuple(position), tuple(new_goal)
+        straight = self.straight_steps(position, new_goal)
+        if self.path_is_free(position, straight):
+            self.stats['straight'] += 1
+            return deque(straight)
+        moved = max(abs(new_goal[0] - old_goal[0]), abs(new_goal[1] - old_goal[1]))
+        if not plan_steps or moved > self.repair_radius:
+            return self.plan(position, new_goal)
+
+        # Walk the remaining path and cut it where it gets closest to the new goal
+        best_index, best_cell = 0, position
+        best_distance = max(abs(new_goal[0] - position[0]), abs(new_goal[1] - position[1]))
+        x, y = position
+        for index, (dx, dy) in enumerate(plan_steps, start=1):
+            x += dx
+            y += dy
+            distance = max(abs(new_goal[0] - x), abs(new_goal[1] - y))
+            if distance < best_distance:
+                best_index, best_cell, best_distance = index, (x, y), distance
+        tail = self.search(best_cell, new_goal)
+        if tail is None:
+            return self.plan(position, new_goal)
+        self.stats['repairs'] += 1
+        return deque(itertools.islice(plan_steps, best_index)) + deque(tail)
+
+"""## Belief store
+
+Drone beliefs are kept as small slotted records during the run and only
+written to the ontology when they are exported.
+"""
+
+class Belief:
+    """A drone's belief that an agent was at a position at a given step."""
+
+    __slots__ = ('holder_id', 'agent', 'agent_id', 'position', 'step', 'confidence')
+
+    def __init__(self, holder_id, agent, position, step, confidence=1.0):
+        self.holder_id = holder_id
+        self.agent = agent
+        self.agent_id = agent.id
+        self.position = position
+        self.step = step
+        self.confidence = confidence
+
+    def __repr__(self):
+        return (f"Belief(holder={self.holder_id}, agent={self.agent_id}, "
+                f"position={self.position}, step={self.step}, confidence={self.confidence})")
+
+# Numbers the belief ontologies, so every model exports into its own
+BELIEF_ONTOLOGIES = itertools.count()
+
+class BeliefStore:
+    """
+    Records the belief revisions of the run.
+
+    The BDI loop reads the Belief records directly. `export` writes the
+    records that were not exported yet into an owlready2 ontology in one
+    batch, at the end of the run or whenever it is called. By default that
+    is the store's own ontology, which imports `onto` for the classes, so
+    two models in one process (e.g. a run and its restored continuation)
+    never add to each other's individuals.
+
+    Once more than `limit` records are kept, the history is compacted to the
+    latest belief of each drone about each agent. Revisions dropped before
+    they were exported never reach the ontology.
+    """
+
+    def __init__(self, model, limit=100_000):
+        self.model = model
+        self.history = []  # Belief records in revision order
+        self.exported = 0  # Number of records of the history already written to an ontology
+        self.limit = limit
+        self.compact_at = limit  # History length that triggers the next compaction
+        self.ontology = None  # Created on the first export
+
+    def revise(self, holder, agent, position, confidence=1.0):
+        """Records and returns a new belief of `holder` about `agent`."""
+        belief = Belief(holder.id, agent, tuple(position), self.model.t, confidence)
+        self.history.append(belief)
+        if len(self.history) > self.compact_at:
+            self.compact()
+        return belief
+
+    def compact(self):
+        """Keeps only the latest belief per (holder, agent), in revision order."""
+        seen, kept, exported = set(), [], 0
+        for index in range(len(self.history) - 1, -1, -1):
+            belief = self.history[index]
+            if (belief.holder_id, belief.agent_id) not in seen:
+                seen.add((belief.holder_id, belief.agent_id))
+                kept.append(belief)
+                exported += index < self.exported
+        kept.reverse()
+        self.history = kept
+        self.exported = exported
+        # Many distinct pairs would otherwise compact on every revision
+        self.compact_at = max(self.limit, 2 * len(kept))
+
+    def __len__(self):
+        return len(self.history)
+
+    def export(self, ontology=None):
+        """
+        Writes the beliefs recorded since the last export into the ontology.
+
+        Each observed agent becomes one Robber individual and each belief a
+        Place linked to it with is_in_place; the believing drone is linked
+        to the robber with detects_suspicion.
+
+        Args:
+            ontology (owlready2.Ontology, optional): Where to write the
+                individuals (default: the store's own ontology).
+
+        Returns:
+            int: The number of beliefs exported.
+        """
+        if ontology is None:
+            if self.ontology is None:
+                self.ontology = get_ontology(f"http://drone-security/beliefs_{next(BELIEF_ONTOLOGIES)}#")
+                self.ontology.imported_ontologies.append(onto)
+            ontology = self.ontology
+        pending = self.history[self.exported:]
+        # Classes are looked up on onto (Robber is also the agent class); the
+        # individuals go to the ontology of the with block
+        with ontology:
+            drones, robbers = {}, {}
+            for belief in pending:
+                robber = robbers.get(belief.agent_id)
+                if robber is None:
+                    robber = onto.Robber(f"robber_{belief.agent_id}")
+                    robbers[belief.agent_id] = robber
+                drone = drones.get(belief.holder_id)
+                if drone is None:
+                    drone = onto.Drone(f"drone_{belief.holder_id}")
+                    drones[belief.holder_id] = drone
+                robber.is_in_place.append(onto.Place(
+                    at_position=str(belief.position),
+                    observed_at=belief.step,
+                    confidence=belief.confidence
+                ))
+                if robber not in drone.detects_suspicion:
+                    drone.detects_suspicion.append(robber)
+        self.exported = len(self.history)
+        return len(pending)
+
+"""## Alert dispatch
+
+Matches open camera alerts to idle drones by travel cost.
+"""
+
+def assign_alerts(drone_positions, alert_positions, exact_max=64):
+    """
+    Assigns alerts to drones, at most one alert per drone.
+
+    Uses the Hungarian method (minimum total Chebyshev travel) when both
+    sides have at most `exact_max` entries, and a greedy nearest-drone
+    matching on a k-d tree otherwise.
+
+    Returns:
+        list: (drone index, alert index) pairs, sorted by drone index.
+    """
+    drones = np.asarray(drone_positions, dtype=np.int64).reshape(-1, 2)
+    alerts = np.asarray(alert_positions, dtype=np.int64).reshape(-1, 2)
+    if len(drones) == 0 or len(alerts) == 0:
+        return []
+    if len(drones) <= exact_max and len(alerts) <= exact_max:
+        cost = np.abs(drones[:, None, :] - alerts[None, :, :]).max(axis=2)
+        rows, cols = linear_sum_assignment(cost)
+        return sorted(zip(rows.tolist(), cols.tolist()))
+    return greedy_assign(drones, alerts)
+
+def greedy_assign(drones, alerts):
+    """
+    Gives each alert, oldest first, the nearest free drone.
+
+    The occupied cells are kept in a k-d tree (Chebyshev metric), so drones
+    sharing a cell, as at a landing station, are one point. An alert asks
+    for its nearest cells, doubling the count while they are all taken; when
+    a query skips more than about sqrt(cells) taken cells, the tree is
+    rebuilt over the free ones. That bounds the cost to O(n^1.5 log n).
+    """
+    cells = {}  # (x, y) -> free drone indices at that cell, lowest last
+    for index, position in enumerate(drones.tolist()):
+        cells.setdefault(tuple(position), []).append(index)
+    for free in cells.values():
+        free.reverse()
+    keys = list(cells)
+    tree = cKDTree(keys)
+
+    pairs = []
+    for alert_index, position in enumerate(alerts.tolist()):
+        if not cells:
+            break
+        k = 1
+        while True:
+            k = min(k, len(keys))
+            distances, found = tree.query(position, k=k, p=np.inf)
+            found = np.atleast_1d(found).tolist()
+            skipped = next((rank for rank, key in enumerate(found) if keys[key] in cells), None)
+            if skipped is not None:
+                break
+            k *= 2
+        key = keys[found[skipped]]
+        free = cells[key]
+        pairs.append((free.pop(), alert_index))
+        if not free:
+            del cells[key]
+        # Rebuild once taken cells crowd the nearest ones
+        if skipped > max(16, math.isqrt(len(keys))) and cells:
+            keys = list(cells)
+            tree = cKDTree(keys)
+    return sorted(pairs)
+
+"""## Alert bus
+
+Per-type alert queues shared by cameras, drones and security personnel.
+"""
+
+class AlertBus:
+    """
+    Typed alert queues with O(1) publish and dequeue.
+
+    Each alert type has its own queue, FIFO by default or ordered by a
+    priority function given for that type (lower values first). Subscribers
+    are called with every alert of the types they subscribed to. The bus
+    also tracks queue depths and how long alerts wait before being handled.
+
+    Alert types with a coalescing rule are treated as events: a new alert
+    that matches an open event (same `key` value, or within `radius` cells
+    when the key is missing) seen in the last `window` steps updates that
+    event's location instead of being queued again. Once an event is closed,
+    new alerts for the same key are dropped for `suppress` steps.
+    """
+
+    def __init__(self, model, priorities=None, coalescing=None):
+        self.model = model
+        self.priorities = priorities or {}  # alert type -> function(alert) -> sortable priority
+        self.coalescing = coalescing or {}  # alert type -> {'key', 'radius', 'window', 'suppress'}
+        self.queues = {}  # alert type -> deque, or heap of (priority, sequence, alert)
+        self.subscribers = {}  # alert type -> list of callbacks
+        self.open_events = {}  # alert type -> {key -> open event}
+        self.suppressed = {}  # alert type -> {key -> step until which it is suppressed}
+        self.sequence = 0
+        self.stats = {}  # alert type -> counters, see metrics()
+
+    def subscribe(self, alert_type, callback):
+        """Calls `callback(alert)` for every alert of `alert_type` published from now on."""
+        self.subscribers.setdefault(alert_type, []).append(callback)
+
+    def type_stats(self, alert_type):
+        if alert_type not in self.stats:
+            self.stats[alert_type] = {'raw': 0, 'published': 0, 'merged': 0, 'suppressed': 0,
+                                      'handled': 0, 'max_depth': 0, 'wait_steps': 0, 'wait_seconds': 0.0}
+        return self.stats[alert_type]
+
+    def matching_event(self, alert, rule):
+        """Finds the open event an alert should be merged into, if any."""
+        events = self.open_events.setdefault(alert['type'], {})
+        key = alert.get(rule['key'])
+        if key is not None:
+            candidates = [events[key]] if key in events else []
+        else:
+            x, y = alert['location']
+            candidates = [
+                event for event in events.values()
+                if max(abs(event['location'][0] - x), abs(event['location'][1] - y)) <= rule['radius']
+            ]
+        for event in candidates:
+            if self.model.t - event['last_seen'] <= rule['window']:
+                return event
+        return None
+
+    def coalesce(self, alert, rule):
+        """Merges an alert into an open event, or registers it as a new one. Returns the event."""
+        stats = self.type_stats(alert['type'])
+        key = alert.get(rule['key'])
+        if key is not None and self.suppressed.get(alert['type'], {}).get(key, -1) > self.model.t:
+            stats['suppressed'] += 1
+            return None
+        event = self.matching_event(alert, rule)
+        if event is not None:
+            event['location'] = alert['location']
+            event['last_seen'] = self.model.t
+            event['merged'] += 1
+            if 'camera' in alert:
+                event['cameras'].add(alert['camera'])
+            stats['merged'] += 1
+            return event
+        alert['last_seen'] = self.model.t
+        alert['merged'] = 0
+        alert['cameras'] = {alert['camera']} if 'camera' in alert else set()
+        alert['event_key'] = key if key is not None else ('area', self.sequence)
+        self.open_events[alert['type']][alert['event_key']] = alert
+        return alert
+
+    def close(self, event):
+        """Ends a coalesced event so later alerts for it start a new one (after any suppression)."""
+        if event is None or 'event_key' not in event:
+            return
+        events = self.open_events.get(event['type'], {})
+        if events.get(event['event_key']) is event:
+            del events[event['event_key']]
+        rule = self.coalescing.get(event['type'])
+        if rule and rule['suppress'] and event.get(rule['key']) is not None:
+            self.suppressed.setdefault(event['type'], {})[event[rule['key']]] = self.model.t + rule['suppress']
+
+    def publish(self, alert):
+        """
+        Queues an alert under its 'type' and delivers it to subscribers.
+
+        Returns:
+            dict: The queued alert, the event it was merged into, or None if
+            it was malformed or suppressed.
+        """
+        if 'type' not in alert:
+            print(f"Malformed alert: {alert}")
+            return None
+        alert_type = alert['type']
+        stats = self.type_stats(alert_type)
+        stats['raw'] += 1
+        rule = self.coalescing.get(alert_type)
+        if rule is not None:
+            event = self.coalesce(alert, rule)
+            if event is not alert:
+                return event
+        alert['step'] = self.model.t
+        alert['published_at'] = time.monotonic()
+        self.sequence += 1
+        priority = self.priorities.get(alert_type)
+        if priority is None:
+            self.queues.setdefault(alert_type, deque()).append(alert)
+        else:
+            heapq.heappush(self.queues.setdefault(alert_type, []), (priority(alert), self.sequence, alert))
+        stats['published'] += 1
+        stats['max_depth'] = max(stats['max_depth'], len(self.queues[alert_type]))
+        for callback in self.subscribers.get(alert_type, ()):
+            callback(alert)
+        return alert
+
+    def handled(self, alert):
+        stats = self.type_stats(alert['type'])
+        stats['handled'] += 1
+        stats['wait_steps'] += self.model.t - alert['step']
+        stats['wait_seconds'] += time.monotonic() - alert['published_at']
+        return alert
+
+    def pop(self, alert_type):
+        """Removes and returns the next alert of a type, or None if there is none."""
+        alert_queue = self.queues.get(alert_type)
+        if not alert_queue:
+            return None
+        if alert_type in self.priorities:
+            return self.handled(heapq.heappop(alert_queue)[2])
+        return self.handled(alert_queue.popleft())
+
+    def drain(self, alert_type):
+        """Removes and returns all queued alerts of a type, in queue order."""
+        alerts = []
+        alert = self.pop(alert_type)
+        while alert is not None:
+            alerts.append(alert)
+            alert = self.pop(alert_type)
+        return alerts
+
+    def queued(self, alert_type):
+        """Lists the queued alerts of a type in the order they would be popped, without removing them."""
+        alert_queue = self.queues.get(alert_type)
+        if not alert_queue:
+            return []
+        if alert_type in self.priorities:
+            return [alert for _, _, alert in sorted(alert_queue, key=lambda item: item[:2])]
+        return list(alert_queue)
+
+    def remove(self, alert_type, alerts):
+        """Removes specific queued alerts of a type, counting them as handled."""
+        if not alerts:
+            return
+        chosen = {id(alert) for alert in alerts}
+        alert_queue = self.queues[alert_type]
+        if alert_type in self.priorities:
+            kept = [item for item in alert_queue if id(item[2]) not in chosen]
+            heapq.heapify(kept)
+        else:
+            kept = deque(alert for alert in alert_queue if id(alert) not in chosen)
+        self.queues[alert_type] = kept
+        for alert in alerts:
+            self.handled(alert)
+
+    def depth(self, alert_type=None):
+        """Number of queued alerts of one type, or of all types."""
+        if alert_type is not None:
+            return len(self.queues.get(alert_type, ()))
+        return sum(len(alert_queue) for alert_queue in self.queues.values())
+
+    def __len__(self):
+        return self.depth()
+
+    def metrics(self):
+        """Per-type raw/published/merged/suppressed/handled counts, queue depth and mean time-to-handle."""
+        report = {}
+        for alert_type, stats in self.stats.items():
+            handled = stats['handled']
+            report[alert_type] = dict(
+                stats,
+                depth=self.depth(alert_type),
+                mean_wait_steps=stats['wait_steps'] / handled if handled else 0.0,
+                mean_wait_seconds=stats['wait_seconds'] / handled if handled else 0.0,
+            )
+        return report
+
+"""## Spatial index
+
+Uniform bucket hash per agent type, so range queries only visit agents of the
+requested type instead of every cell in the range.
+"""
+
+class SpatialIndex:
+    """Buckets agents by type and by a coarse square cell of `bucket_size`."""
+
+    def __init__(self, bucket_size=8):
+        self.bucket_size = bucket_size
+        self.buckets = {}  # agent type -> {bucket key -> set of agents}
+        self.keys = {}  # agent -> (agent type, bucket key)
+
+    def bucket_of(self, position):
+        return (position[0] // self.bucket_size, position[1] // self.bucket_size)
+
+    def add(self, agent, position):
+        agent_type = type(agent)
+        key = self.bucket_of(position)
+        self.buckets.setdefault(agent_type, {}).setdefault(key, set()).add(agent)
+        self.keys[agent] = (agent_type, key)
+
+    def remove(self, agent):
+        agent_type, key = self.keys.pop(agent)
+        bucket = self.buckets[agent_type][key]
+        bucket.discard(agent)
+        if not bucket:
+            del self.buckets[agent_type][key]
+
+    def move(self, agent, position):
+        agent_type, key = self.keys[agent]
+        new_key = self.bucket_of(position)
+        if new_key != key:
+            self.remove(agent)
+            self.add(agent, position)
+
+    def query(self, agent_type, low, high):
+        """Yields agents of `agent_type` in buckets overlapping the box [low, high]."""
+        type_buckets = self.buckets.get(agent_type)
+        if not type_buckets:
+            return
+        bx0, by0 = self.bucket_of(low)
+        bx1, by1 = self.bucket_of(high)
+        # Few robbers over a large range: walking the occupied buckets is cheaper
+        if len(type_buckets) < (bx1 - bx0 + 1) * (by1 - by0 + 1):
+            for (bx, by), bucket in type_buckets.items():
+                if bx0 <= bx <= bx1 and by0 <= by <= by1:
+                    yield from bucket
+        else:
+            for bx in range(bx0, bx1 + 1):
+                for by in range(by0, by1 + 1):
+                    yield from type_buckets.get((bx, by), ())
+
+
+class IndexedGridMixin:
+    """Keeps a SpatialIndex up to date on every add, move and removal of a grid."""
+
+    def setup(self, bucket_size=8):
+        self.index = SpatialIndex(bucket_size)
+
+    def _add_agent(self, agent, position, field):
+        super()._add_agent(agent, position, field)
+        self.index.add(agent, self.positions[agent])
+
+    def remove_agents(self, agents):
+        for agent in ap.tools.make_list(agents):
+            self.index.remove(agent)
+        super().remove_agents(agents)
+
+    def move_to(self, agent, pos):
+        super().move_to(agent, pos)
+        self.index.move(agent, self.positions[agent])
+
+    def neighbors_of_type(self, agent, agent_type, distance=1):
+        """
+        Select agents of a given type within a given distance of an agent.
+
+        Covers the same square area as `neighbors()` and yields matches in the
+        same row-major cell order, but only visits agents of `agent_type`.
+
+        Args:
+            agent (ap.Agent): The agent at the centre of the range.
+            agent_type (type): Class of the agents to look for, e.g. Robber.
+            distance (int): Number of cells to cover in each direction.
+        """
+        x, y = self.positions[agent]
+        low = (max(x - distance, 0), max(y - distance, 0))
+        high = (min(x + distance, self.shape[0] - 1), min(y + distance, self.shape[1] - 1))
+        found = []
+        for other in self.index.query(agent_type, low, high):
+            position = self.positions[other]
+            if other is not agent and low[0] <= position[0] <= high[0] and low[1] <= position[1] <= high[1]:
+                found.append((position, other))
+        found.sort(key=lambda item: item[0])
+        return [other for _, other in found]
+
+class IndexedGrid(IndexedGridMixin, ap.Grid):
+    """ap.Grid with a per-type spatial index for range queries."""
+
+
+class SparseGrid(ap.objects.SpatialEnvironment):
+    """
+    Grid environment that only stores occupied cells.
+
+    Offers the ap.Grid surface used by the model (positions, add_agents,
+    remove_agents, move_to, move_by, neighbors and attr_grid) with memory
+    proportional to the number of agents rather than cells, for very large
+    worlds. Random placement draws the same cells as ap.Grid for a given
+    seed. Empty-cell tracking is not supported.
+    """
+
+    def __init__(self, model, shape, torus=False, check_border=True, **kwargs):
+        super().__init__(model)
+        self._check_border = check_border
+        self._torus = torus
+        self.positions = {}
+        self.cells = {}  # position -> list of agents, only for occupied cells
+        self.shape = tuple(shape)
+        self.ndim = len(self.shape)
+        self.empty = None
+        self._set_var_ignore()
+        self.setup(**kwargs)
+
+    @property
+    def agents(self):
+        return ap.AgentIter(self.model, self.positions.keys())
+
+    @property
+    def all(self):
+        """Lazy iterator over all positions, in ap.Grid order."""
+        return itertools.product(*[range(x) for x in self.shape])
+
+    def _add_agent(self, agent, position, field):
+        position = tuple(position)
+        self.cells.setdefault(position, []).append(agent)
+        self.positions[agent] = position
+
+    def add_agents(self, agents, positions=None, random=False, empty=False):
+        """Adds agents at the given positions, or at random or consecutive cells."""
+        if empty:
+            raise ap.tools.AgentpyError("SparseGrid does not track empty cells.")
+        if positions:
+            pass
+        elif random:
+            # Same draws as random.choices(Grid.all), without listing every cell
+            cells = self.model.random.choices(range(math.prod(self.shape)), k=len(agents))
+            positions = [tuple(int(i) for i in np.unravel_index(cell, self.shape)) for cell in cells]
+        else:
+            positions = itertools.cycle(self.all)
+        for agent, position in zip(agents, positions):
+            self._add_agent(agent, position, 'agents')
+
+    def remove_agents(self, agents):
+        """Removes agents from the environment."""
+        for agent in ap.tools.make_list(agents):
+            position = self.positions.pop(agent)
+            cell = self.cells[position]
+            cell.remove(agent)
+            if not cell:
+                del self.cells[position]
+
+    def move_to(self, agent, pos):
+        """Moves agent to a new position."""
+        pos_old = self.positions[agent]
+        if pos != pos_old:
+            if self._check_border:
+                pos = ap.Grid._border_behavior(pos, self.shape, self._torus)
+            cell = self.cells[pos_old]
+            cell.remove(agent)
+            if not cell:
+                del self.cells[pos_old]
+            self.cells.setdefault(pos, []).append(agent)
+            self.positions[agent] = pos
+
+    def move_by(self, agent, path):
+        """Moves agent to a new position, relative to its current position."""
+        pos = [p + c for p, c in zip(self.positions[agent], path)]
+        self.move_to(agent, tuple(pos))
+
+    def neighbors(self, agent, distance=1):
+        """
+        Select neighbors of an agent within a given distance, in row-major cell order.
+
+        Scans the occupied cells or the cells in range, whichever is fewer.
+        The toroidal wrap-around of ap.Grid is not supported here.
+        """
+        if self._torus:
+            raise ap.tools.AgentpyError("SparseGrid.neighbors() does not support torus grids.")
+        pos = self.positions[agent]
+        low = [max(p - distance, 0) for p in pos]
+        high = [min(p + distance, x - 1) for p, x in zip(pos, self.shape)]
+        if len(self.cells) < math.prod(h - l + 1 for l, h in zip(low, high)):
+            cells = sorted(c for c in self.cells
+                           if all(l <= p <= h for p, l, h in zip(c, low, high)))
+        else:
+            cells = itertools.product(*[range(l, h + 1) for l, h in zip(low, high)])
+        found = [other for c in cells for other in self.cells.get(c, ()) if other is not agent]
+        return ap.AgentIter(self.model, found)
+
+    def attr_grid(self, attr_key, otypes='f', field='agents'):
+        """
+        Dense grid with the attribute of the first agent in each cell, NaN elsewhere.
+
+        Allocates the full world, so it is only meant for plotting small worlds.
+        """
+        grid = np.full(self.shape, np.nan, dtype=otypes)
+        for position, cell in self.cells.items():
+            grid[position] = getattr(cell[0], attr_key)
+        return grid
+
+
+class SparseIndexedGrid(IndexedGridMixin, SparseGrid):
+    """SparseGrid with a per-type spatial index for range queries."""
+
+"""## Camera coverage
+
+Cameras never move, so the cells each one sees are computed once: as a packed
+bitmask per cell, or for big worlds as camera squares bucketed by coarse
+tile. Camera detection is then a lookup of every robber's cell instead of a
+range scan per camera.
+"""
+
+class CoverageMap:
+    """
+    Which cameras cover each cell, for the square range that Grid.neighbors()
+    would scan from the camera.
+
+    When the bounding box of the covered cells has at most SPARSE_GRID_CELLS
+    cells, `labels[x - origin[0], y - origin[1]]` holds one bit per camera
+    (little-endian within each byte), and a lookup is one table read. Beyond
+    that, the table would take box area * ceil(cameras / 8) bytes, so the
+    cameras are instead bucketed in `tiles` of one square's width, and a cell
+    is tested against the few cameras of its tile. Memory then grows with the
+    camera count only.
+    """
+
+    def __init__(self, shape, camera_positions=(), detection_range=18):
+        self.shape = tuple(shape)
+        self.detection_range = detection_range
+        self.tile_size = 2 * detection_range + 1
+        self.camera_positions = []
+        self.cameras = np.zeros((0, 2), dtype=np.int64)
+        self.origin = np.zeros(2, dtype=np.int64)
+        self.labels = np.zeros((0, 0, 0), dtype=np.uint8)
+        self.tiles = None  # tile id -> camera indices, in tile mode
+        self.set_cameras(camera_positions)
+
+    def set_cameras(self, camera_positions):
+        """Rebuilds the table if cameras were added, removed or moved."""
+        camera_positions = [tuple(position) for position in camera_positions]
+        if camera_positions == self.camera_positions:
+            return
+        self.camera_positions = camera_positions
+        self.cameras = np.array(camera_positions, dtype=np.int64).reshape(-1, 2)
+        r = self.detection_range
+        if camera_positions:
+            self.origin = np.maximum(self.cameras.min(axis=0) - r, 0)
+            end = np.minimum(self.cameras.max(axis=0) + r, np.array(self.shape) - 1)
+        else:
+            self.origin = end = np.zeros(2, dtype=np.int64) - 1
+        if math.prod((end - self.origin + 1).tolist()) > SPARSE_GRID_CELLS:
+            self.labels = np.zeros((0, 0, 0), dtype=np.uint8)
+            self.tiles = {}
+            for index, (x, y) in enumerate(camera_positions):
+                # A square one tile wide overlaps at most 2 x 2 tiles
+                for tx in {max(x - r, 0) // self.tile_size, min(x + r, self.shape[0] - 1) // self.tile_size}:
+                    for ty in {max(y - r, 0) // self.tile_size, min(y + r, self.shape[1] - 1) // self.tile_size}:
+                        self.tiles.setdefault(self.tile_id(tx, ty), []).append(index)
+            self.tiles = {tile: np.array(indices) for tile, indices in self.tiles.items()}
+            return
+        self.tiles = None
+        labels = np.zeros(tuple(end - self.origin + 1) + ((len(camera_positions) + 7) // 8,), dtype=np.uint8)
+        for index, (x, y) in enumerate(camera_positions):
+            x, y = x - self.origin[0], y - self.origin[1]
+            labels[max(x - r, 0):x + r + 1, max(y - r, 0):y + r + 1, index // 8] |= np.uint8(1 << (index % 8))
+        self.labels = labels
+
+    def tile_id(self, tx, ty):
+        return tx * (self.shape[1] // self.tile_size + 1) + ty
+
+    def covers(self, positions, cameras):
+        """(positions, cameras) boolean matrix of which camera covers which position."""
+        offsets = np.abs(positions[:, None, :] - self.cameras[cameras][None, :, :])
+        return (offsets <= self.detection_range).all(axis=2)
+
+    def cameras_at(self, position):
+        """Indices of the cameras that cover a cell."""
+        if self.tiles is not None:
+            position = np.asarray(position, dtype=np.int64).reshape(1, 2)
+            cameras = self.tiles.get(self.tile_id(*(position[0] // self.tile_size).tolist()))
+            if cameras is None:
+                return np.zeros(0, dtype=np.int64)
+            return np.sort(cameras[self.covers(position, cameras)[0]])
+        x, y = np.asarray(position) - self.origin
+        if not (0 <= x < self.labels.shape[0] and 0 <= y < self.labels.shape[1]):
+            return np.zeros(0, dtype=np.int64)
+        bits = np.unpackbits(self.labels[x, y], count=len(self.camera_positions), bitorder='little')
+        return np.flatnonzero(bits)
+
+    def detect(self, positions):
+        """
+        For each camera, find the first position in row-major cell order that it covers.
+
+        Positions in the same cell keep their given order.
+
+        Returns:
+            np.ndarray: Index into `positions` per camera, -1 where none is covered.
+        """
+        result = np.full(len(self.camera_positions), -1, dtype=np.int64)
+        positions = np.asarray(positions, dtype=np.int64).reshape(-1, 2)
+        if len(positions) == 0 or len(result) == 0:
+            return result
+        order = np.argsort(positions[:, 0] * self.shape[1] + positions[:, 1], kind='stable')
+        if self.tiles is not None:
+            return self.detect_tiled(positions[order], order, result)
+        cells = positions[order] - self.origin
+        inside = np.all((cells >= 0) & (cells < self.labels.shape[:2]), axis=1)
+        order, cells = order[inside], cells[inside]
+        if len(order) == 0:
+            return result
+        hits = np.unpackbits(self.labels[cells[:, 0], cells[:, 1]], axis=1,
+                             count=len(result), bitorder='little').astype(bool)
+        first = hits.argmax(axis=0)
+        found = hits[first, np.arange(len(result))]
+        result[found] = order[first[found]]
+        return result
+
+    def detect_tiled(self, positions, order, result):
+        """detect() in tile mode, for positions already in row-major order."""
+        tile_size = self.tile_size
+        tiles = self.tile_id(positions[:, 0] // tile_size, positions[:, 1] // tile_size)
+        ranks = np.flatnonzero(np.isin(tiles, list(self.tiles)))
+        if len(ranks) == 0:
+            return result
+        # Group the ranks by tile; a stable sort keeps each group in row-major order
+        ranks = ranks[np.argsort(tiles[ranks], kind='stable')]
+        groups, starts = np.unique(tiles[ranks], return_index=True)
+        first = np.full(len(result), len(positions), dtype=np.int64)
+        for tile, group in zip(groups.tolist(), np.split(ranks, starts[1:])):
+            cameras = self.tiles[tile]
+            hits = self.covers(positions[group], cameras)
+            found = hits.any(axis=0)
+            np.minimum.at(first, cameras[found], group[hits.argmax(axis=0)[found]])
+        found = first < len(positions)
+        result[found] = order[first[found]]
+        return result
+
+"""## Checkpoints
+
+A checkpoint is the state of a SurveillanceModel between two steps as plain
+data: agent positions and ids as arrays, agent attributes, alerts, beliefs and
+the random number generator states. References to agents, alerts and beliefs
+are stored as ids, so the model objects, the HTTP clients and the owlready2
+ontology are never pickled; the ontology is rebuilt from the beliefs.
+"""
+
+CHECKPOINT_VERSION = 1
+
+# Agent lists of the model, in the order they are saved and restored, with
+# their agent class and type name (as sent to Unity and in the event trace)
+AGENT_LISTS = {
+    'drone': (DroneAgent, 'Drone'),
+    'cameras': (CameraAgent, 'Camera'),
+    'robber': (Robber, 'Robber'),
+    'security': (SecurityPersonnelAgent, 'Security'),
+}
+
+# Agent attributes set by agentpy rather than by the agent's setup
+AGENT_BASE_ATTRIBUTES = {'id', 'type', 'log', 'model', 'p'}
+
+BELIEF_DTYPE = np.dtype([
+    ('holder', '<i4'), ('agent', '<i4'), ('x', '<i4'), ('y', '<i4'), ('step', '<u4'), ('confidence', '<f8')
+])
+
+class AgentRef:
+    """An agent in a checkpoint, by id."""
+
+    __slots__ = ('id',)
+
+    def __init__(self, id):
+        self.id = id
+
+    def __reduce__(self):
+        return AgentRef, (self.id,)
+
+class AlertRef:
+    """An alert in a checkpoint, by index in its alert table."""
+
+    __slots__ = ('index',)
+
+    def __init__(self, index):
+        self.index = index
+
+    def __reduce__(self):
+        return AlertRef, (self.index,)
+
+class BeliefRef:
+    """A belief in a checkpoint, by index in the belief history."""
+
+    __slots__ = ('index',)
+
+    def __init__(self, index):
+        self.index = index
+
+    def __reduce__(self):
+        return BeliefRef, (self.index,)
+
+class CheckpointEncoder:
+    """Replaces agents, alerts and beliefs in nested values by references."""
+
+    def __init__(self, model, alerts, beliefs):
+        self.agents = {agent.id for name in AGENT_LISTS for agent in getattr(model, name)}
+        self.alerts = {id(alert): index for index, alert in enumerate(alerts)}
+        self.beliefs = {id(belief): index for index, belief in enumerate(beliefs)}
+        self.detached = {}  # id -> class name of referenced agents no longer in the model
+
+    def encode(self, value):
+        if isinstance(value, ap.Agent):
+            if value.id not in self.agents:
+                self.detached[value.id] = type(value).__name__
+            return AgentRef(value.id)
+        if isinstance(value, Belief):
+            return BeliefRef(self.beliefs[id(value)])
+        if isinstance(value, dict):
+            if id(value) in self.alerts:
+                return AlertRef(self.alerts[id(value)])
+            return {self.encode(key): self.encode(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple, set, deque)):
+            return type(value)(self.encode(item) for item in value)
+        return value
+
+    def encode_alert(self, alert):
+        """An alert's own fields; the monotonic publish time is stored as an age."""
+        fields = {key: self.encode(item) for key, item in alert.items()}
+        if 'published_at' in alert:
+            fields['published_at'] = time.monotonic() - alert['published_at']
+        return fields
+
+class CheckpointDecoder:
+    """Resolves the references of a checkpoint against a restored model."""
+
+    def __init__(self, agents, alerts=(), beliefs=()):
+        self.agents = agents  # id -> agent
+        self.alerts = alerts
+        self.beliefs = beliefs
+
+    def decode(self, value):
+        if isinstance(value, AgentRef):
+            return self.agents[value.id]
+        if isinstance(value, AlertRef):
+            return self.alerts[value.index]
+        if isinstance(value, BeliefRef):
+            return self.beliefs[value.index]
+        if isinstance(value, dict):
+            return {self.decode(key): self.decode(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple, set, deque)):
+            return type(value)(self.decode(item) for item in value)
+        return value
+
+def save_checkpoint(state, path):
+    """Writes a checkpoint to a gzip-compressed file."""
+    with gzip.open(path, 'wb', compresslevel=3) as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def load_checkpoint(path):
+    """Reads a checkpoint written by save_checkpoint."""
+    with gzip.open(path, 'rb') as f:
+        state = pickle.load(f)
+    if state.get('version') != CHECKPOINT_VERSION:
+        raise ValueError(f"{path} is not a version {CHECKPOINT_VERSION} checkpoint")
+    return state
+
+"""## Frame rendering
+
+Headless recording of the grid as it is drawn by animation_plot. The model
+only computes which cells changed since the previous frame; a background
+thread paints them into a reusable RGB frame and streams it to the output.
+"""
+
+# Colors of the agent types 0-3, as ap.gridplot draws them with 'Accent'
+AGENT_COLORS = (plt.get_cmap('Accent')(np.arange(4) / 3)[:, :3] * 255).astype(np.uint8)
+BACKGROUND_COLOR = np.array([255, 255, 255], dtype=np.uint8)
+
+class FfmpegFrameWriter:
+    """Pipes raw RGB frames to ffmpeg, which encodes them by the file extension (.mp4, .gif, ...)."""
+
+    def __init__(self, path, frame_shape, fps=10):
+        command = [
+            plt.rcParams['animation.ffmpeg_path'], '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f"{frame_shape[1]}x{frame_shape[0]}",
+            '-r', str(fps), '-i', '-',
+        ]
+        if not path.endswith('.gif'):
+            command += ['-pix_fmt', 'yuv420p', '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2']
+        try:
+            self.process = subprocess.Popen(command + [path], stdin=subprocess.PIPE)
+        except FileNotFoundError:
+            raise RuntimeError("Recording video or GIF requires ffmpeg; use a .npz output instead.")
+
+    def write(self, step, frame):
+        self.process.stdin.write(frame.tobytes())
+
+    def close(self):
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise RuntimeError(f"ffmpeg exited with status {self.process.returncode}")
+
+class NpzFrameWriter:
+    """
+    Writes frames to a compressed .npz archive in chunks of as many frames
+    as fit in `chunk_bytes` (at least one; 'frames_0', 'frames_1', ...) plus
+    their 'steps', so only one chunk is held in memory. Read it back with
+    load_frames.
+    """
+
+    def __init__(self, path, frame_shape, chunk_bytes=64 * 2**20):
+        self.archive = zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1)
+        chunk_size = max(1, chunk_bytes // math.prod(frame_shape))
+        self.chunk = np.empty((chunk_size,) + tuple(frame_shape), dtype=np.uint8)
+        self.length = 0
+        self.chunks = 0
+        self.steps = []
+
+    def write(self, step, frame):
+        self.chunk[self.length] = frame
+        self.length += 1
+        self.steps.append(step)
+        if self.length == len(self.chunk):
+            self.flush()
+
+    def write_array(self, name, array):
+        with self.archive.open(f"{name}.npy", 'w', force_zip64=True) as f:
+            np.lib.format.write_array(f, array)
+
+    def flush(self):
+        if self.length:
+            self.write_array(f"frames_{self.chunks}", self.chunk[:self.length])
+            self.chunks += 1
+            self.length = 0
+
+    def close(self):
+        self.flush()
+        self.write_array('steps', np.array(self.steps, dtype=np.int64))
+        self.archive.close()
+
+def load_frames(path):
+    """Loads an archive written by NpzFrameWriter: (steps, frames of shape (n, rows, columns, 3))."""
+    with np.load(path) as archive:
+        chunks = sorted((name for name in archive.files if name.startswith('frames_')),
+                        key=lambda name: int(name.split('_')[1]))
+        frames = [archive[name] for name in chunks]
+        steps = archive['steps']
+    if not frames:
+        return steps, np.empty((0, 0, 0, 3), dtype=np.uint8)
+    return steps, np.concatenate(frames)
+
+class FrameRenderer:
+    """
+    Records the grid to a video, GIF or .npz frame stack without matplotlib.
+
+    Each cell is drawn as a `scale` x `scale` square in the color of its
+    agent's type, like animation_plot. `capture` sends only the cells that
+    changed since the previous frame to a writer thread, which keeps the
+    frame buffer, paints the changes and hands the frame to the output. The
+    queue between them is bounded, and .npz output is buffered in chunks of
+    at most `chunk_bytes`, so memory stays constant over long runs.
+    """
+
+    def __init__(self, path, world_size, scale=4, fps=10, queue_size=64, chunk_bytes=64 * 2**20):
+        self.path = path
+        self.scale = scale
+        self.frame = np.empty((world_size[0] * scale, world_size[1] * scale, 3), dtype=np.uint8)
+        self.frame[:] = BACKGROUND_COLOR
+        if path.endswith('.npz'):
+            self.writer = NpzFrameWriter(path, self.frame.shape, chunk_bytes)
+        else:
+            self.writer = FfmpegFrameWriter(path, self.frame.shape, fps)
+        self.cells = {}  # position -> agent type drawn in the previous frame
+        self.frames = 0
+        self.closed = False
+        self.error = None
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def capture(self, model, step=None):
+        """Queues a frame of the model's grid, labelled with `step` (default: the model's)."""
+        cells = {}
+        for name in AGENT_LISTS:
+            for agent in getattr(model, name):
+                cells[model.grid.positions[agent]] = agent.agent_type
+        changes = [(position, agent_type) for position, agent_type in cells.items()
+                   if self.cells.get(position) != agent_type]
+        changes += [(position, -1) for position in self.cells.keys() - cells.keys()]
+        self.cells = cells
+        if self.error is not None:
+            raise self.error
+        self.queue.put((model.t if step is None else step, changes))
+        self.frames += 1
+
+    def run(self):
+        """Writer thread: paints the changed cells of each frame and writes it."""
+        colors = np.vstack([AGENT_COLORS, BACKGROUND_COLOR])  # Index -1 is the background
+        size = self.scale
+        blocks = self.frame.reshape(self.frame.shape[0] // size, size, self.frame.shape[1] // size, size, 3)
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            step, changes = item
+            if self.error is not None:
+                continue  # Drain the queue so capture never blocks
+            try:
+                if changes:
+                    positions, agent_types = zip(*changes)
+                    x, y = np.array(positions).T
+                    blocks[x, :, y, :] = colors[np.array(agent_types)][:, None, None, :]
+                self.writer.write(step, self.frame)
+            except Exception as error:
+                self.error = error
+
+    def close(self):
+        """Writes the queued frames and finalizes the output."""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+        error = self.error
+        try:
+            self.writer.close()
+        except Exception as close_error:
+            error = error or close_error
+        if error is not None:
+            raise error
+
 """## Simulation"""
 
+# World area above which SurveillanceModel uses a SparseGrid by default
+SPARSE_GRID_CELLS = 1_000_000
+
+# Fixed position of the security personnel
+SECURITY_POSITION = (5, 5)
+
+
 class SurveillanceModel(ap.Model):
     def setup(self):
         """Initialize the simulation with agents and a shared environment."""
-        # Hardcoded world size
-        world_size = (100, 100)
+        world_size = tuple(self.p.worldSize)
 
         # Retrieve parameters
         drone_count = self.p.droneAgents
-        camera_count = self.p.cameraAgents
+        camera_positions = self.camera_layout(self.p)
+        camera_count = len(camera_positions)
         robber_count = self.p.robberAgents
 
+        # Event trace, printed to the console as a filter over its events
+        self.trace = EventTrace(self.p.get('tracePath'), self.p.get('traceCapacity', 65536),
+                                self.p.get('verbose', True))
+        self.trace.record(self.t, 'world', position=world_size)
+
         # Create agents using ap.AgentList
         self.drone = ap.AgentList(self, drone_count, DroneAgent)
         self.cameras = ap.AgentList(self, camera_count, CameraAgent)
         self.robber = ap.AgentList(self, robber_count, Robber)
         self.security = ap.AgentList(self, 1, SecurityPersonnelAgent)
 
-        # Create a grid
-        self.grid = ap.Grid(self, world_size, track_empty=True)
+        # Create a grid with a per-type spatial index for range queries. Large
+        # worlds use a sparse grid that only stores the occupied cells.
+        if self.p.get('sparseGrid', math.prod(world_size) > SPARSE_GRID_CELLS):
+            self.grid = SparseIndexedGrid(self, world_size)
+        else:
+            self.grid = IndexedGrid(self, world_size, track_empty=True)
 
-        # Place agents on the grid
-        self.grid.add_agents(
-            self.drone, 
-            positions=[(world_size[0] // 2, world_size[1] // 2)]  # Drone at center
-        )
+        # Fixed positions must lie in the world; a SparseGrid would not notice
+        stations = self.landing_stations(self.p, world_size)
+        self.check_positions('Camera', camera_positions, world_size)
+        self.check_positions('Landing station', stations, world_size)
+        self.check_positions('Security', [SECURITY_POSITION], world_size)
+
+        # Place agents on the grid, drones spread over the landing stations
+        landing_positions = [stations[i % len(stations)] for i in range(drone_count)]
+        self.grid.add_agents(self.drone, positions=landing_positions)
         self.grid.add_agents(self.robber, random=True)  # Place robber randomly
         for index, robber in enumerate(self.robber, start=1):
             position = self.grid.positions[robber]
-            print(f"Robber{index} placed at position: {position}")
+            self.trace.record(self.t, 'robber_placed', robber.id, position, f"Robber{index}")
 
-        # Define fixed camera positions forming a triangle
-        camera_positions = self.calculate_camera_positions(camera_count)
+        # Fixed camera positions, from cameraPositions or the default triangle
         self.cameras = ap.AgentList(self, camera_count, CameraAgent)
         self.grid.add_agents(self.cameras, positions=camera_positions)
 
@@ -541,20 +2098,128 @@ class SurveillanceModel(ap.Model):
         for idx, camera in enumerate(self.cameras, start=1):
             camera.name = f"CCTVCAM{idx}"
 
+        # Camera coverage, computed once since the cameras never move
+        self.coverage = CoverageMap(world_size, detection_range=self.cameras[0].detection_range)
+        self.update_coverage()
+
         self.grid.add_agents(
             self.security, 
-            positions=[(5, 5)]  # Fixed position for security personnel
+            positions=[SECURITY_POSITION]  # Fixed position for security personnel
         )
 
-        # Initialize landing position for the drones
-        for drone in self.drone:
-            drone.landing_position = (world_size[0] // 2, world_size[1] // 2)
+        for name, (_, agent_type) in AGENT_LISTS.items():
+            for agent in getattr(self, name):
+                self.trace.record(self.t, 'placed', agent.id, self.grid.positions[agent], agent_type)
 
-        # Create a shared alert system
-        self.alerts = []
+        # Initialize landing position for the drones
+        for drone, landing_position in zip(self.drone, landing_positions):
+            drone.landing_position = landing_position
+
+        # Path planner shared by the drones, with optional no-fly zones
+        self.planner = PathPlanner(world_size, PathPlanner.no_fly_cells(self.p.get('noFlyZones', [])))
+
+        # Create a shared alert system. Repeated camera detections of the same
+        # robber update one event instead of queuing a new alert each time.
+        self.alerts = AlertBus(self, coalescing={
+            'camera_signal': {
+                'key': 'robber',
+                'radius': self.p.get('alertMergeRadius', 2),
+                'window': self.p.get('alertMergeWindow', 3),
+                'suppress': self.p.get('alertSuppressSteps', 0),
+            }
+        })
+
+        # Drone beliefs, exported to the ontology in bulk at the end
+        self.beliefs = BeliefStore(self, self.p.get('beliefHistoryLimit', 100_000))
+
+        # Phases of a step, in order, and their optional profiler
+        self.phases = {
+            'robber': self.robber.step,
+            'cameras': self.cameras.step,
+            'dispatch': self.dispatch_alerts,
+            'drone': self.drone.step,
+            'security': self.security.step,
+        }
+        self.profiler = None
+        if self.p.get('profile'):
+            self.profiler = Profiler(self.p.get('profileOutput', 'profile'))
+
+        # Batched, non-blocking position updates for Unity, and concurrent
+        # computational vision checks for the cameras
+        self.start_clients()
+
+        # Optional headless recording of the grid, see FrameRenderer
+        self.renderer = None
+        if self.p.get('renderOutput'):
+            self.start_renderer(self.p['renderOutput'])
+
+    def start_clients(self):
+        """Creates the HTTP clients for Unity and computational vision, closed at the end of the run."""
+        self.telemetry = TelemetryClient()
+        self.vision = VisionChecker()
+        self.telemetry.profiler = self.profiler
+        self.vision.profiler = self.profiler
+
+    def start_renderer(self, path):
+        """Starts recording every 'renderEvery' steps to `path` (.mp4, .gif or .npz)."""
+        self.renderer = FrameRenderer(path, self.grid.shape, self.p.get('renderScale', 4), self.p.get('renderFps', 10),
+                                      chunk_bytes=self.p.get('renderChunkBytes', 64 * 2**20))
+
+    def update_coverage(self):
+        """Rebuilds the camera coverage table; call it after adding or moving cameras."""
+        for index, camera in enumerate(self.cameras):
+            camera.coverage_index = index
+        self.coverage.set_cameras([self.grid.positions[camera] for camera in self.cameras])
+        self.detections_step = None
+
+    def camera_detections(self):
+        """First robber in range of each camera this step, looked up once for all cameras."""
+        if self.detections_step != self.t:
+            robbers = list(self.robber)
+            found = self.coverage.detect([self.grid.positions[robber] for robber in robbers])
+            self.detections = [robbers[index] if index >= 0 else None for index in found]
+            self.detections_step = self.t
+        return self.detections
+
+    @staticmethod
+    def landing_stations(p, world_size):
+        """Landing stations from the 'landingStations' parameter, or the world center."""
+        stations = p.get('landingStations')
+        if not stations:
+            return [(world_size[0] // 2, world_size[1] // 2)]
+        return [tuple(station) for station in stations]
+
+    def dispatch_alerts(self):
+        """Assigns queued camera alerts to idle drones by minimum travel cost."""
+        events = self.alerts.queued('camera_signal')
+        if not events:
+            return
+        idle = [drone for drone in self.drone
+                if not drone.alert_sent and drone.intention != 'verify_camera_alert']
+        pairs = assign_alerts(
+            [self.grid.positions[drone] for drone in idle],
+            [event['location'] for event in events],
+            self.p.get('dispatchExactMax', 64)
+        )
+        self.alerts.remove('camera_signal', [events[alert] for _, alert in pairs])
+        for drone, alert in pairs:
+            idle[drone].assign_alert(events[alert])
 
-    def calculate_camera_positions(self, camera_count):
-        """Calculate camera positions to form a triangle within the 100x100 grid."""
+    @staticmethod
+    def camera_layout(p):
+        """
+        Camera positions from the 'cameraPositions' parameter (e.g. a layout
+        found by camera_placement.py), or the default triangle of
+        'cameraAgents' cameras.
+        """
+        positions = p.get('cameraPositions')
+        if positions:
+            return [tuple(position) for position in positions]
+        return SurveillanceModel.calculate_camera_positions(p['cameraAgents'], tuple(p.get('worldSize', (100, 100))))
+
+    @staticmethod
+    def calculate_camera_positions(camera_count, world_size=(100, 100)):
+        """Calculate camera positions to form a triangle, scaled from the 100x100 grid to `world_size`."""
         if camera_count < 3:
             raise ValueError("At least 3 cameras are required to form a triangle.")
         
@@ -564,35 +2229,279 @@ class SurveillanceModel(ap.Model):
             (80, 20),    # Camera 2
             (50, 80)     # Camera 3
         ]
+        vertices = [(round(x * world_size[0] / 100), round(y * world_size[1] / 100)) for x, y in vertices]
         # If more than 3 cameras, distribute additional cameras along the triangle edges
         additional_cameras = camera_count - 3
         if additional_cameras > 0:
-            edge1 = self.interpolate_positions(vertices[0], vertices[1], additional_cameras // 2)
-            edge2 = self.interpolate_positions(vertices[1], vertices[2], additional_cameras - (additional_cameras // 2))
+            edge1 = SurveillanceModel.interpolate_positions(vertices[0], vertices[1], additional_cameras // 2)
+            edge2 = SurveillanceModel.interpolate_positions(vertices[1], vertices[2], additional_cameras - (additional_cameras // 2))
             vertices.extend(edge1 + edge2)
 
         return vertices[:camera_count]
 
-    def interpolate_positions(self, start, end, count):
-        """Interpolate positions between two points."""
+    @staticmethod
+    def check_positions(kind, positions, world_size):
+        """Raises a ValueError if any of the positions is outside the world."""
+        for position in positions:
+            if not all(0 <= value < size for value, size in zip(position, world_size)):
+                raise ValueError(f"{kind} position {tuple(position)} is outside the "
+                                 f"{world_size[0]}x{world_size[1]} world.")
+
+    @staticmethod
+    def interpolate_positions(start, end, count):
+        """Interpolate positions between two points, rounded to grid cells."""
         positions = []
         for i in range(1, count + 1):
             x = start[0] + (end[0] - start[0]) * i / (count + 1)
             y = start[1] + (end[1] - start[1]) * i / (count + 1)
-            positions.append((x, y))
+            positions.append((round(x), round(y)))
         return positions
 
     def step(self):
         """Run the simulation for one step."""
-        self.robber.step()
-        self.cameras.step()
-        self.drone.step()
-        self.security.step()
+        if self.renderer is not None and self.renderer.frames == 0:
+            self.renderer.capture(self, self.t - 1)  # The state the run starts from
+        if self.profiler is None:
+            for phase in self.phases.values():
+                phase()
+        else:
+            self.profiler.run_step(self.t, self.phases)
+        self.telemetry.end_step(self.t)
+        every = self.p.get('checkpointEvery')
+        if every and self.t % every == 0:
+            self.checkpoint(self.p.get('checkpointPath', 'checkpoint_{step}.ckpt').format(step=self.t))
+        if self.renderer is not None and self.t % self.p.get('renderEvery', 1) == 0:
+            self.renderer.capture(self)
 
     def end(self):
         """Finalize the simulation."""
+        if self.running:
+            return  # Drones call end() on every capture; the run finishes later
+        self.telemetry.close()
+        self.vision.close()
+        self.trace.flush()
+        if self.renderer is not None:
+            self.renderer.close()
+        if self.profiler is not None:
+            print(self.profiler.write())
+        if self.p.get('beliefOntologyFile'):
+            self.beliefs.export()
+            self.beliefs.ontology.save(file=self.p['beliefOntologyFile'])
         print("Simulation completed!")
 
+    def sim_setup(self, steps=None, seed=None):
+        """Sets up a new run, or continues a partly-run or restored model where it stopped."""
+        if not self._partly_run:
+            return super().sim_setup(steps, seed)
+        self._steps = self.t + steps if steps is not None else self.p.get('steps', np.nan)
+        self.running = self.t < self._steps
+        if self.telemetry.closed:
+            self.start_clients()
+        if self.renderer is not None and self.renderer.closed:
+            # Each continuation is recorded to its own file
+            root, extension = os.path.splitext(self.p['renderOutput'])
+            self.start_renderer(f"{root}_{self.t}{extension}")
+
+    def add_drones(self, count, stations=None):
+        """
+        Launches `count` more drones during a run, e.g. after restoring a checkpoint.
+
+        Args:
+            count (int): Number of drones.
+            stations (list, optional): Their landing stations (default: the
+                model's, continuing the round-robin of the existing drones).
+
+        Returns:
+            ap.AgentList: The new drones.
+        """
+        offset = 0 if stations else len(self.drone)
+        if stations:
+            stations = [tuple(station) for station in stations]
+        else:
+            stations = self.landing_stations(self.p, tuple(self.p.worldSize))
+        self.check_positions('Landing station', stations, self.grid.shape)
+        drones = ap.AgentList(self, count, DroneAgent)
+        positions = [stations[(offset + i) % len(stations)] for i in range(count)]
+        self.grid.add_agents(drones, positions=positions)
+        for drone, position in zip(drones, positions):
+            drone.landing_position = position
+            self.trace.record(self.t, 'placed', drone.id, position, 'Drone')
+        self.drone.extend(drones)
+        return drones
+
+    def checkpoint(self, path=None):
+        """
+        Captures the state of the model between two steps.
+
+        Vision checks still in flight are waited for, so their results are
+        part of the checkpoint.
+
+        Args:
+            path (str, optional): File to write the checkpoint to.
+
+        Returns:
+            dict: The checkpoint, see SurveillanceModel.restore.
+        """
+        bus = self.alerts
+        # Every alert reachable from the queues, the open events and the drones, once
+        alerts = {}
+        for alert_queue in bus.queues.values():
+            for item in alert_queue:
+                alert = item[2] if isinstance(item, tuple) else item
+                alerts[id(alert)] = alert
+        for events in bus.open_events.values():
+            alerts.update((id(event), event) for event in events.values())
+        alerts.update((id(drone.camera_alert), drone.camera_alert) for drone in self.drone
+                      if drone.camera_alert is not None)
+        alerts = list(alerts.values())
+        history = self.beliefs.history
+        encoder = CheckpointEncoder(self, alerts, history)
+
+        agents = {}
+        for name in AGENT_LISTS:
+            members = list(getattr(self, name))
+            agents[name] = {
+                'ids': np.array([agent.id for agent in members], dtype=np.int64),
+                'positions': np.array([self.grid.positions[agent] for agent in members],
+                                      dtype=np.int64).reshape(-1, 2),
+                'attributes': [
+                    {key: encoder.encode(value) for key, value in vars(agent).items()
+                     if key not in AGENT_BASE_ATTRIBUTES and not key.startswith('_')}
+                    for agent in members
+                ],
+            }
+        beliefs = np.array([
+            (belief.holder_id, belief.agent_id, belief.position[0], belief.position[1],
+             belief.step, belief.confidence)
+            for belief in history
+        ], dtype=BELIEF_DTYPE)
+        for belief in history:
+            encoder.encode(belief.agent)  # Registers robbers removed since
+        state = {
+            'version': CHECKPOINT_VERSION,
+            'parameters': dict(self.p),
+            't': self.t,
+            'id_counter': self._id_counter,
+            'random': self.random.getstate(),
+            'nprandom': self.nprandom.bit_generator.state,
+            'agents': agents,
+            'beliefs': beliefs,
+            'alerts': [encoder.encode_alert(alert) for alert in alerts],
+            'alert_bus': {
+                'queues': encoder.encode(bus.queues),
+                'open_events': encoder.encode(bus.open_events),
+                'suppressed': encoder.encode(bus.suppressed),
+                'sequence': bus.sequence,
+                'stats': encoder.encode(bus.stats),
+            },
+            'vision': self.vision.results(),
+        }
+        state['detached'] = encoder.detached
+        if path is not None:
+            save_checkpoint(state, path)
+        return state
+
+    @classmethod
+    def restore(cls, checkpoint, parameters=None):
+        """
+        Creates a model that continues from a checkpoint.
+
+        The model is set up from the checkpoint's parameters, updated with
+        `parameters`, and its agents, alerts, beliefs and random number
+        generators are then replaced by the checkpoint's. Parameters read at
+        setup (e.g. verbose, tracePath, alert merging) can be changed this
+        way; a different 'seed' reseeds the random number generators so the
+        continuation diverges. Beliefs are all re-exported, to the restored
+        model's own ontology.
+        Continue with `model.run(steps)`.
+
+        The original run's outputs are never written over: the restored run
+        has no trace file, periodic checkpoints or recording unless
+        `parameters` set 'tracePath', 'checkpointEvery' (with a new
+        'checkpointPath') or 'renderOutput' again.
+
+        Args:
+            checkpoint (dict or str): A checkpoint or the path of its file.
+            parameters (dict, optional): Parameters to change.
+
+        Returns:
+            SurveillanceModel: The restored model.
+        """
+        if isinstance(checkpoint, str):
+            checkpoint = load_checkpoint(checkpoint)
+        params = dict(checkpoint['parameters'], tracePath=None, checkpointEvery=None, renderOutput=None)
+        params.update(parameters or {})
+        model = cls(params)
+        model.t = checkpoint['t']
+        model.sim_setup(steps=0)
+
+        classes = {agent_class.__name__: agent_class for agent_class, _ in AGENT_LISTS.values()}
+        existing = {agent.id: agent for name in AGENT_LISTS for agent in getattr(model, name)}
+        agents = {}
+
+        def create(agent_class, agent_id):
+            agent = agent_class(model)
+            agent.id = agent_id
+            return agent
+
+        # Agents of the checkpoint: reuse the ones setup created, create the others
+        for name, saved in checkpoint['agents'].items():
+            members = []
+            agent_class, agent_type = AGENT_LISTS[name]
+            for agent_id, position in zip(saved['ids'].tolist(), saved['positions'].tolist()):
+                agent = existing.pop(agent_id, None) or create(agent_class, agent_id)
+                position = tuple(position)
+                if agent in model.grid.positions:
+                    model.grid.move_to(agent, position)
+                else:
+                    model.grid.add_agents([agent], positions=[position])
+                model.trace.record(model.t, 'placed', agent.id, position, agent_type)
+                agents[agent_id] = agent
+                members.append(agent)
+            # Keep the list objects: the step phases refer to them
+            agent_list = getattr(model, name)
+            agent_list.clear()
+            agent_list.extend(members)
+        for agent in existing.values():
+            model.trace.record(model.t, 'removed', agent.id, model.grid.positions[agent])
+            model.grid.remove_agents(agent)
+        for agent_id, class_name in checkpoint['detached'].items():
+            agents[agent_id] = create(classes[class_name], agent_id)
+
+        # Beliefs, then alerts, then everything that refers to them
+        decoder = CheckpointDecoder(agents)
+        history = []
+        for holder, agent_id, x, y, step, confidence in checkpoint['beliefs'].tolist():
+            belief = Belief(holder, agents[agent_id], (x, y), step, confidence)
+            history.append(belief)
+        model.beliefs.history = history
+        decoder.beliefs = history
+        alerts = [{} for _ in checkpoint['alerts']]
+        decoder.alerts = alerts
+        now = time.monotonic()
+        for alert, fields in zip(alerts, checkpoint['alerts']):
+            alert.update(decoder.decode(fields))
+            if 'published_at' in alert:
+                alert['published_at'] = now - alert['published_at']
+        bus = model.alerts
+        for key, value in checkpoint['alert_bus'].items():
+            setattr(bus, key, decoder.decode(value))
+        for name, saved in checkpoint['agents'].items():
+            for agent, attributes in zip(getattr(model, name), saved['attributes']):
+                for key, value in attributes.items():
+                    setattr(agent, key, decoder.decode(value))
+        model.update_coverage()
+        model.vision.restore(checkpoint['vision'])
+
+        model._id_counter = checkpoint['id_counter']
+        if params.get('seed') != checkpoint['parameters'].get('seed'):
+            model.random = random.Random(params['seed'])
+            model.nprandom = np.random.default_rng(model.random.getrandbits(128))
+        else:
+            model.random.setstate(checkpoint['random'])
+            model.nprandom.bit_generator.state = checkpoint['nprandom']
+        return model
+
 def animation_plot(model, ax):
     """Visualizes the grid and agent types."""
     # Use attr_grid to get agent_type for each grid cell
@@ -610,14 +2519,25 @@ parameters = {
     "seed": 75,  # Generates a random seed each run
 }
 
-# Create figure for animation
-fig, ax = plt.subplots(figsize=(8, 8))
-
-# Create and run the model
-model = SurveillanceModel(parameters)
+if __name__ == "__main__":
+    # Create and run the model
+    model = SurveillanceModel(parameters)
 
-# Run the simulation with animation
-animation = ap.animate(model, fig, ax, animation_plot)
+    if parameters.get('renderOutput') or parameters.get('profile'):
+        # Record headlessly with FrameRenderer, or profile the steps without
+        # the animation's drawing, instead of animating in memory
+        model.run()
+    else:
+        # Create figure for animation
+        fig, ax = plt.subplots(figsize=(8, 8))
 
-# Display the animation
-IPython.display.HTML(animation.to_jshtml())
\ No newline at end of file
+        try:
+            # Run the simulation with animation
+            animation = ap.animate(model, fig, ax, animation_plot)
+
+            # Display the animation
+            IPython.display.HTML(animation.to_jshtml())
+        finally:
+            # ap.animate never calls end(), so finish the run here
+            model.running = False
+            model.end()
\ No newline at end of file
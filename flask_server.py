@@ -1,32 +1,340 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, Response, g
 import base64
-from io import BytesIO
-from PIL import Image
 import os
 import threading
 import time
 import requests
 import random
 import subprocess
+import json
+import queue
+from collections import deque, OrderedDict
 from ultralytics import YOLO
 import cv2
 import numpy as np
 
 app = Flask(__name__)
 
-# In-memory storage for agent positions
+# In-memory storage for agent positions, keyed by agent key ("<type>_<id>",
+# or just the type for senders that do not identify their agents)
 agent_positions = {}
+positions_lock = threading.Lock()
 
 # In-memory storage for alarm status
 alarm_status = {'alarm_alerted': False, 'position': None}
 
+# Queues of the clients connected to /stream
+subscribers = []
+subscribers_lock = threading.Lock()
+SUBSCRIBER_QUEUE_SIZE = 256
+STREAM_KEEPALIVE_SECONDS = 15
+
 # Define the folder to store images
 IMAGE_FOLDER = 'agent_images'
 os.makedirs(IMAGE_FOLDER, exist_ok=True)
 
+# In-memory ring buffer of the latest decoded frames (BGR arrays) per camera
+FRAME_BUFFER_SIZE = int(os.environ.get('FRAME_BUFFER_SIZE', 4))
+# Save every Nth ingested frame of a camera to IMAGE_FOLDER (0 disables it)
+PERSIST_EVERY_N_FRAMES = int(os.environ.get('PERSIST_EVERY_N_FRAMES', 0))
+camera_frames = {}
+frame_sequence = {}
+frames_lock = threading.Lock()
+
+# Prometheus-style metrics served at /metrics. Updates are a dict lookup and
+# an addition under a lock, cheap enough to leave on at full frame rates.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class Counter:
+    """A monotonically increasing value per label set."""
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        with self.lock:
+            values = dict(self.values)
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(values.items()):
+            lines.append(f"{self.name}{format_labels(self.labels, label_values)} {value}")
+        return lines
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observations per label set."""
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}  # label values -> [bucket counts..., sum, count]
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self.lock:
+            series = self.values.get(label_values)
+            if series is None:
+                series = self.values[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            # Values above the last bound only show up in the +Inf bucket (the count)
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        with self.lock:
+            values = {key: list(series) for key, series in self.values.items()}
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_values, series in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series[:-2]):
+                cumulative += count
+                bucket_labels = format_labels(self.labels + ('le',), label_values + (bound,))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            bucket_labels = format_labels(self.labels + ('le',), label_values + ('+Inf',))
+            lines.append(f"{self.name}_bucket{bucket_labels} {series[-1]}")
+            labels = format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {series[-2]}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+def format_labels(names, values):
+    """Renders {name="value",...} with the text format's escaping."""
+    if not names:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in values)
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, escaped)) + '}'
+
+http_requests = Counter('http_requests_total', 'HTTP requests by route, method and status.',
+                        ('route', 'method', 'status'))
+http_latency = Histogram('http_request_duration_seconds', 'Time to build the response, by route.',
+                         ('route', 'method'))
+inference_latency = Histogram('inference_batch_duration_seconds', 'YOLO forward pass time per batch.')
+inference_frames = Counter('inference_frames_total', 'Frames and crops run through the model.')
+decode_latency = Histogram('frame_decode_duration_seconds', 'Time to decode an ingested frame.', ('format',))
+encode_latency = Histogram('frame_encode_duration_seconds', 'Time to encode an annotated frame.', ('format',))
+ingested_bytes = Counter('frame_ingested_bytes_total', 'Bytes of frames received, by camera.', ('camera',))
+ingested_frames = Counter('frame_ingested_total', 'Frames received, by camera.', ('camera',))
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        http_latency.observe(time.perf_counter() - started, route, request.method)
+        http_requests.inc(route, request.method, response.status_code)
+    return response
+
 # Load the trained model with explicit task definition
 model = YOLO(r'C:\Users\ID140\Desktop\AgentSimulation\weights.onnx', task='detect')
 
+# Micro-batching limits for the inference worker
+INFERENCE_MAX_BATCH = int(os.environ.get('INFERENCE_MAX_BATCH', 8))
+INFERENCE_MAX_WAIT_MS = float(os.environ.get('INFERENCE_MAX_WAIT_MS', 10))
+
+class InferenceRequest:
+    """One frame waiting for the inference worker, and the slot for its result."""
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.submitted = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class InferenceWorker:
+    """
+    Runs the YOLO model on a dedicated thread in micro-batches.
+
+    Request handlers submit a frame and wait; the worker collects pending
+    frames until it has `max_batch` of them or `max_wait_ms` passed since the
+    first one, runs a single forward pass and hands each caller its result.
+    """
+
+    def __init__(self, model, max_batch=INFERENCE_MAX_BATCH, max_wait_ms=INFERENCE_MAX_WAIT_MS):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.pending = queue.Queue()
+        self.stats_lock = threading.Lock()
+        self.batch_sizes = {}  # batch size -> number of batches
+        self.latencies = deque(maxlen=1000)  # Recent per-request latency in seconds
+        self.requests_done = 0
+        self.inference_seconds = 0.0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, frame):
+        """Blocks until the frame has been through the model and returns its result."""
+        return self.submit_many([frame])[0]
+
+    def submit_many(self, frames):
+        """Queues several frames at once (so they can share a batch) and waits for all."""
+        items = [InferenceRequest(frame) for frame in frames]
+        for item in items:
+            self.pending.put(item)
+        for item in items:
+            item.done.wait()
+            if item.error is not None:
+                raise item.error
+        return [item.result for item in items]
+
+    def collect(self):
+        batch = [self.pending.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.collect()
+            started = time.perf_counter()
+            try:
+                results = self.model([item.frame for item in batch], verbose=False)
+                for item, result in zip(batch, results):
+                    item.result = result
+            except Exception as e:
+                for item in batch:
+                    item.error = e
+            finished = time.perf_counter()
+            inference_latency.observe(finished - started)
+            inference_frames.inc(amount=len(batch))
+            with self.stats_lock:
+                self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+                self.requests_done += len(batch)
+                self.inference_seconds += finished - started
+                self.latencies.extend(finished - item.submitted for item in batch)
+            for item in batch:
+                item.done.set()
+
+    def stats(self):
+        with self.stats_lock:
+            latencies = sorted(self.latencies)
+            batches = sum(self.batch_sizes.values())
+            summary = {
+                'requests': self.requests_done,
+                'batches': batches,
+                'batch_sizes': {str(size): count for size, count in sorted(self.batch_sizes.items())},
+                'mean_batch_size': self.requests_done / batches if batches else 0,
+                'inference_seconds': self.inference_seconds,
+                'queued': self.pending.qsize(),
+            }
+        if latencies:
+            summary['latency_ms'] = {
+                'p50': 1000 * latencies[len(latencies) // 2],
+                'p95': 1000 * latencies[int(len(latencies) * 0.95)],
+                'max': 1000 * latencies[-1],
+            }
+        return summary
+
+inference_worker = InferenceWorker(model)
+
+# Detection results per (camera, frame version), bounded in size and age
+DETECTION_CACHE_SIZE = int(os.environ.get('DETECTION_CACHE_SIZE', 64))
+DETECTION_CACHE_TTL = float(os.environ.get('DETECTION_CACHE_TTL', 30))
+detection_cache = OrderedDict()
+detection_cache_lock = threading.Lock()
+detection_cache_stats = {'hits': 0, 'misses': 0}
+
+def cached_detection(camera_name, version):
+    """Returns the cached detection of a frame version, or None if missing or expired."""
+    key = (camera_name, version)
+    with detection_cache_lock:
+        entry = detection_cache.get(key)
+        if entry is not None and time.time() - entry['time'] > DETECTION_CACHE_TTL:
+            del detection_cache[key]
+            entry = None
+        if entry is None:
+            detection_cache_stats['misses'] += 1
+            return None
+        detection_cache.move_to_end(key)
+        detection_cache_stats['hits'] += 1
+        return entry
+
+def cache_detection(camera_name, version, entry):
+    with detection_cache_lock:
+        detection_cache[(camera_name, version)] = entry
+        detection_cache.move_to_end((camera_name, version))
+        while len(detection_cache) > DETECTION_CACHE_SIZE:
+            detection_cache.popitem(last=False)
+
+def parse_position(position):
+    """Returns a position dict with x, y (and z) or None if the format is invalid."""
+    if isinstance(position, list):
+        if len(position) >= 2:
+            position_dict = {'x': position[0], 'y': position[1]}
+            if len(position) >= 3:
+                position_dict['z'] = position[2]
+            return position_dict
+    elif isinstance(position, dict) and 'x' in position and 'y' in position:
+        return position
+    return None
+
+def agent_key(agent_type, agent_id=None):
+    return agent_type if agent_id is None else f"{agent_type}_{agent_id}"
+
+def position_changed(previous, entry):
+    if previous is None:
+        return True
+    return any(previous.get(axis) != entry.get(axis) for axis in ('x', 'y', 'z'))
+
+class Subscriber:
+    """A /stream client: a bounded event queue plus a flag for when it fell behind."""
+
+    def __init__(self, agent_type=None):
+        self.agent_type = agent_type
+        self.events = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.lagging = False
+
+    def push(self, event, data):
+        if event == 'positions' and self.agent_type:
+            data = {key: entry for key, entry in data.items() if entry.get('agent_type') == self.agent_type}
+            if not data:
+                return
+        try:
+            self.events.put_nowait((event, data))
+        except queue.Full:
+            # Too slow to keep up: drop deltas and send a full snapshot instead
+            self.lagging = True
+
+def publish(event, data):
+    """Pushes an event to every connected /stream client without blocking."""
+    with subscribers_lock:
+        current = list(subscribers)
+    for subscriber in current:
+        subscriber.push(event, data)
+
+def sse_message(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def position_snapshot(agent_type=None):
+    with positions_lock:
+        return {
+            key: entry for key, entry in agent_positions.items()
+            if agent_type is None or entry.get('agent_type') == agent_type
+        }
+
 @app.route('/update_position', methods=['POST'])
 def update_position():
     data = request.get_json()
@@ -34,41 +342,236 @@ def update_position():
     position = data.get('position')
     
     if agent_type and position:
-        if isinstance(position, list):
-            if len(position) >= 2:
-                position_dict = {'x': position[0], 'y': position[1]}
-                if len(position) >= 3:
-                    position_dict['z'] = position[2]
-                agent_positions[agent_type] = position_dict
-                print(f"{agent_type} position updated: {position_dict}")
-                return jsonify({'status': 'success'}), 200
-            else:
-                print(f"Invalid position list for {agent_type}: {position}")
-                return jsonify({'status': 'failure', 'reason': 'Invalid position list length'}), 400
-        elif isinstance(position, dict) and 'x' in position and 'y' in position:
-            agent_positions[agent_type] = position
-            print(f"{agent_type} position updated: {position}")
-            return jsonify({'status': 'success'}), 200
-        else:
+        position_dict = parse_position(position)
+        if position_dict is None:
             print(f"Invalid position format for {agent_type}: {position}")
             return jsonify({'status': 'failure', 'reason': 'Invalid position format'}), 400
+        key = agent_key(agent_type, data.get('agent_id'))
+        entry = dict(position_dict, agent_type=agent_type, agent_id=data.get('agent_id'), step=data.get('step'))
+        with positions_lock:
+            moved = position_changed(agent_positions.get(key), entry)
+            agent_positions[key] = entry
+        if moved:
+            publish('positions', {key: entry})
+        print(f"{agent_type} position updated: {position_dict}")
+        return jsonify({'status': 'success'}), 200
     else:
         return jsonify({'status': 'failure', 'reason': 'Invalid data'}), 400
 
+@app.route('/update_positions', methods=['POST'])
+def update_positions():
+    """
+    Bulk update for a whole simulation step.
+
+    Expects {'step': int, 'positions': [{'agent_type', 'agent_id', 'position'}, ...]}.
+    Valid entries are applied, invalid ones are reported back by index, and
+    updates older than the stored step of the same agent are ignored.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('positions'), list):
+        return jsonify({'status': 'failure', 'reason': 'Invalid data'}), 400
+    step = data.get('step')
+    if not isinstance(step, int):
+        return jsonify({'status': 'failure', 'reason': 'Missing step number'}), 400
+
+    updated = 0
+    rejected = []
+    changed = {}
+    with positions_lock:
+        for index, item in enumerate(data['positions']):
+            agent_type = item.get('agent_type') if isinstance(item, dict) else None
+            position_dict = parse_position(item.get('position')) if agent_type else None
+            if position_dict is None or item.get('agent_id') is None:
+                rejected.append(index)
+                continue
+            key = agent_key(agent_type, item['agent_id'])
+            previous = agent_positions.get(key)
+            if previous and isinstance(previous.get('step'), int) and previous['step'] > step:
+                continue  # A newer step already arrived for this agent
+            entry = dict(position_dict, agent_type=agent_type, agent_id=item['agent_id'], step=step)
+            if position_changed(previous, entry):
+                changed[key] = entry
+            agent_positions[key] = entry
+            updated += 1
+
+    if changed:
+        publish('positions', changed)
+
+    if rejected:
+        print(f"Step {step}: rejected invalid positions at {rejected}")
+    return jsonify({'status': 'success', 'step': step, 'updated': updated, 'rejected': rejected}), 200
+
 @app.route('/get_positions', methods=['GET'])
 def get_positions():
-    return jsonify(agent_positions), 200
+    """Returns the full position table, optionally filtered with ?type=<agent_type>."""
+    return jsonify(position_snapshot(request.args.get('type'))), 200
+
+@app.route('/stream', methods=['GET'])
+def stream():
+    """
+    Server-Sent Events stream of position deltas and alarm changes.
+
+    Starts with a full snapshot, then sends a 'positions' event with only the
+    agents that moved (deltas queued in between are merged into one message)
+    and an 'alarm' event whenever the alarm status changes. Accepts ?type= to
+    only receive one agent type.
+    """
+    subscriber = Subscriber(request.args.get('type'))
+    with subscribers_lock:
+        subscribers.append(subscriber)
+
+    def events():
+        try:
+            yield sse_message('positions', position_snapshot(subscriber.agent_type))
+            yield sse_message('alarm', dict(alarm_status))
+            while True:
+                try:
+                    event, data = subscriber.events.get(timeout=STREAM_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                if subscriber.lagging:
+                    subscriber.lagging = False
+                    while not subscriber.events.empty():
+                        subscriber.events.get_nowait()
+                    yield sse_message('positions', position_snapshot(subscriber.agent_type))
+                    yield sse_message('alarm', dict(alarm_status))
+                    continue
+                pending = [(event, data)]
+                while not subscriber.events.empty():
+                    pending.append(subscriber.events.get_nowait())
+                positions = {}
+                for event, data in pending:
+                    if event == 'positions':
+                        positions.update(data)
+                    else:
+                        if positions:
+                            yield sse_message('positions', positions)
+                            positions = {}
+                        yield sse_message(event, data)
+                if positions:
+                    yield sse_message('positions', positions)
+        finally:
+            with subscribers_lock:
+                subscribers.remove(subscriber)
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(events(), mimetype='text/event-stream', headers=headers)
 
 @app.route('/get_position/<agent_type>', methods=['GET'])
 def get_position(agent_type):
-    position = agent_positions.get(agent_type)
+    """Looks up an agent key, falling back to the lowest id of that agent type."""
+    with positions_lock:
+        position = agent_positions.get(agent_type)
+        if position is None:
+            matches = [entry for entry in agent_positions.values() if entry.get('agent_type') == agent_type]
+            if matches:
+                position = min(matches, key=lambda entry: (len(str(entry['agent_id'])), str(entry['agent_id'])))
     if position:
         return jsonify(position), 200
     else:
         return jsonify({'error': f"Agent '{agent_type}' not found."}), 404
 
+def store_frame(camera_name, frame):
+    """Adds a decoded frame to the camera's ring buffer and returns its sequence number."""
+    with frames_lock:
+        sequence = frame_sequence.get(camera_name, 0) + 1
+        frame_sequence[camera_name] = sequence
+        frames = camera_frames.get(camera_name)
+        if frames is None:
+            frames = camera_frames[camera_name] = deque(maxlen=FRAME_BUFFER_SIZE)
+        frames.append({'sequence': sequence, 'time': time.time(), 'image': frame})
+    return sequence
+
+def latest_frame(camera_name):
+    """Returns the newest buffered frame entry of a camera, or None."""
+    with frames_lock:
+        frames = camera_frames.get(camera_name)
+        return frames[-1] if frames else None
+
+def vision_path(camera_name):
+    return os.path.join(IMAGE_FOLDER, f"{camera_name}_{camera_name}_vision.png")
+
+def decode_frame(body, content_type, width=None, height=None):
+    """
+    Decodes a raw request body into a BGR array, the layout cv2.imread returns.
+
+    Args:
+        body (bytes): PNG/JPEG bytes, or packed 8-bit RGB pixels.
+        content_type (str): 'image/png', 'image/jpeg' or 'application/octet-stream'.
+        width (int): Frame width, required for raw RGB.
+        height (int): Frame height, required for raw RGB.
+    """
+    started = time.perf_counter()
+    if content_type in ('image/png', 'image/jpeg'):
+        frame = cv2.imdecode(np.frombuffer(body, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            raise ValueError('Could not decode image')
+        decode_latency.observe(time.perf_counter() - started, content_type)
+        return frame
+    if content_type == 'application/octet-stream':
+        if not width or not height or len(body) != width * height * 3:
+            raise ValueError('Raw RGB frames need width and height matching the body size')
+        rgb = np.frombuffer(body, dtype=np.uint8).reshape(height, width, 3)
+        frame = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+        decode_latency.observe(time.perf_counter() - started, content_type)
+        return frame
+    raise ValueError(f"Unsupported content type '{content_type}'")
+
+def ingest_frame(camera_name, frame, path=None, encoded=None):
+    """
+    Buffers a decoded frame and saves every PERSIST_EVERY_N_FRAMES-th one.
+
+    Saved frames go to `path` (default: the camera's vision file), as the
+    original `encoded` bytes when given, or else encoded to PNG.
+
+    Returns:
+        tuple: (sequence number, whether the frame was saved).
+    """
+    sequence = store_frame(camera_name, frame)
+    if not (PERSIST_EVERY_N_FRAMES and sequence % PERSIST_EVERY_N_FRAMES == 0):
+        return sequence, False
+    path = path or vision_path(camera_name)
+    if encoded is None:
+        cv2.imwrite(path, frame)
+    else:
+        with open(path, 'wb') as image_file:
+            image_file.write(encoded)
+    return sequence, True
+
+@app.route('/send_frame/<camera_name>', methods=['POST'])
+def send_frame(camera_name):
+    """
+    Binary frame ingestion: the body is the image itself, no base64 or JSON.
+
+    PNG/JPEG bodies are decoded once into the in-memory ring buffer. Raw RGB
+    bodies (application/octet-stream) need ?width=&height=, and ?flip=1 for
+    bottom-up rows such as Unity's GetRawTextureData. Frames only reach disk
+    when PERSIST_EVERY_N_FRAMES is set.
+    """
+    body = request.get_data(cache=False)
+    if not body:
+        return jsonify({'status': 'failure', 'reason': 'No image data provided'}), 400
+    ingested_bytes.inc(camera_name, amount=len(body))
+    ingested_frames.inc(camera_name)
+    try:
+        frame = decode_frame(body, request.mimetype,
+                             request.args.get('width', type=int), request.args.get('height', type=int))
+    except ValueError as e:
+        return jsonify({'status': 'failure', 'reason': str(e)}), 400
+    if request.args.get('flip') == '1':
+        frame = frame[::-1]
+
+    sequence, _ = ingest_frame(camera_name, frame)
+    return jsonify({'status': 'success', 'camera': camera_name, 'sequence': sequence}), 200
+
 @app.route('/send_vision/<agent_type>', methods=['POST'])
 def send_vision(agent_type):
+    """
+    Legacy JSON ingestion with a base64 image, for clients that do not use
+    /send_frame yet. Frames go to the same ring buffer, and only every
+    PERSIST_EVERY_N_FRAMES-th one is saved, under the given filename.
+    """
     try:
         data = request.get_json()
         image_data = data.get('image')
@@ -79,14 +582,16 @@ def send_vision(agent_type):
         
         # Decode the base64 string into bytes
         img_bytes = base64.b64decode(image_data)
+        ingested_bytes.inc(agent_type, amount=len(img_bytes))
+        ingested_frames.inc(agent_type)
         
-        # Convert bytes into an image and save
-        image = Image.open(BytesIO(img_bytes))
+        # Keep the decoded frame in memory for inference; sampled frames are
+        # saved as the original bytes, without re-encoding them
         file_path = os.path.join(IMAGE_FOLDER, f"{agent_type}_{filename}")
-        image.save(file_path)
-        
-        print(f"Received and saved image for {agent_type}: {file_path}")
-        return jsonify({'status': 'success', 'filename': f"{agent_type}_{filename}"}), 200
+        sequence, saved = ingest_frame(agent_type, decode_frame(img_bytes, 'image/png'), file_path, img_bytes)
+        if saved:
+            print(f"Received and saved image for {agent_type}: {file_path}")
+        return jsonify({'status': 'success', 'filename': f"{agent_type}_{filename}", 'sequence': sequence}), 200
     except Exception as e:
         print(f"Error processing image: {e}")
         return jsonify({'status': 'error', 'message': 'Failed to process image'}), 400
@@ -110,8 +615,11 @@ def start_simulation():
 @app.route('/alert_alarm', methods=['POST'])
 def alert_alarm():
     data = request.get_json()
+    previous = dict(alarm_status)
     alarm_status['alarm_alerted'] = data.get('alarm_alerted', False)
     alarm_status['position'] = data.get('position', None)
+    if alarm_status != previous:
+        publish('alarm', dict(alarm_status))
     print(f"Alarm status updated: {alarm_status['alarm_alerted']}, Position: {alarm_status['position']}")
     return jsonify({'status': 'success'}), 200
 
@@ -119,58 +627,250 @@ def alert_alarm():
 def get_alarm_status():
     return jsonify(alarm_status), 200
 
-@app.route('/check_image/<camera_name>', methods=['GET'])
-def check_image(camera_name):
-    try:
-        # Construct the filename based on the camera name
-        filename = f"{camera_name}_{camera_name}_vision.png"
-        image_path = os.path.join(IMAGE_FOLDER, filename)
-        
-        if not os.path.exists(image_path):
-            return jsonify({'status': 'failure', 'reason': 'Image not found'}), 404
-        
-        # Load the image
-        frame = cv2.imread(image_path)
+# Motion gating: a small grayscale copy of each camera's previous frame decides
+# whether a frame changed enough to be worth running YOLO on, and a background
+# model of the same size where
+MOTION_WIDTH = int(os.environ.get('MOTION_WIDTH', 160))  # Width of the background model
+MOTION_PIXEL_THRESHOLD = 25  # Gray-level difference for a pixel to count as moving
+MOTION_ENERGY_THRESHOLD = float(os.environ.get('MOTION_ENERGY_THRESHOLD', 0.0005))  # Moving pixel fraction
+MOTION_BACKGROUND_RATE = 0.05  # How fast the background absorbs a changing frame
+MOTION_MAX_ROIS = 4
+MOTION_ROI_PADDING = 0.5  # Extra margin around each motion box, relative to its size
+MOTION_FULL_FRAME_RATIO = 0.5  # Above this crop area, run the full frame instead
+motion_backgrounds = {}  # camera -> (background, previous frame), both small grayscale
+last_detections = {}  # camera -> latest detection entry, returned for static frames
+motion_lock = threading.Lock()
 
-        # Perform inference
-        results = model(frame)
+def motion_regions(camera_name, frame):
+    """
+    Compares a frame with the camera's previous frame and background model.
 
-        # Annotate frame with detections
-        annotated_frame = results[0].plot()
+    A frame that did not change since the previous check is static: it
+    becomes the background at once and has no motion, so a newly stopped
+    object does not keep triggering inference while the background slowly
+    absorbs it. Otherwise the motion is where the frame differs from the
+    background, which then moves towards the frame.
 
-        # Save the annotated frame to a file
-        output_path = os.path.join(IMAGE_FOLDER, f"{camera_name}_annotated.png")
-        cv2.imwrite(output_path, annotated_frame)
-        print(f"Annotated image saved to: {output_path}")
+    Returns:
+        tuple: (energy, boxes), the fraction of moving pixels and the motion
+        bounding boxes as (x1, y1, x2, y2) in full-frame coordinates. Boxes is
+        None when there is no background yet (first frame or new size).
+    """
+    height, width = frame.shape[:2]
+    scale = min(1.0, MOTION_WIDTH / width)
+    small = cv2.resize(frame, (max(1, int(width * scale)), max(1, int(height * scale))),
+                       interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.float32)
 
-        # Initialize positions list
-        positions = []
+    with motion_lock:
+        background, previous = motion_backgrounds.get(camera_name, (None, None))
+        if background is None or background.shape != gray.shape:
+            motion_backgrounds[camera_name] = (gray.copy(), gray)
+            return 1.0, None
+        motion_backgrounds[camera_name] = (background, gray)
+        energy = float((np.abs(gray - previous) > MOTION_PIXEL_THRESHOLD).mean())
+        if energy < MOTION_ENERGY_THRESHOLD:
+            background[:] = gray
+            return energy, []
+        mask = (np.abs(gray - background) > MOTION_PIXEL_THRESHOLD).astype(np.uint8)
+        cv2.accumulateWeighted(gray, background, MOTION_BACKGROUND_RATE)
 
-        # Check if any objects are detected
-        if results[0].boxes:
-            for box in results[0].boxes:
-                x1, y1, x2, y2 = box.xyxy[0]
-                positions.append({
-                    'x1': int(x1.item()),
-                    'y1': int(y1.item()),
-                    'x2': int(x2.item()),
-                    'y2': int(y2.item())
-                })
-            return jsonify({
-                'status': 'success',
-                'sus_object_detected': True,
-                'annotated_image': output_path,
-                'positions': positions
-            }), 200
+    energy = float(mask.mean())
+    if energy < MOTION_ENERGY_THRESHOLD:
+        return energy, []
+
+    mask = cv2.dilate(mask, np.ones((3, 3), np.uint8))
+    count, _, stats, _ = cv2.connectedComponentsWithStats(mask)
+    # Largest components first, anything past MOTION_MAX_ROIS is merged into the last box
+    components = sorted(stats[1:count], key=lambda row: row[cv2.CC_STAT_AREA], reverse=True)
+    boxes = []
+    for x, y, w, h, _ in components:
+        pad_x, pad_y = w * MOTION_ROI_PADDING, h * MOTION_ROI_PADDING
+        box = [max(0, int((x - pad_x) / scale)), max(0, int((y - pad_y) / scale)),
+               min(width, int((x + w + pad_x) / scale) + 1), min(height, int((y + h + pad_y) / scale) + 1)]
+        if len(boxes) < MOTION_MAX_ROIS:
+            boxes.append(box)
         else:
-            return jsonify({
-                'status': 'success',
-                'sus_object_detected': False,
-                'annotated_image': output_path,
-                'positions': positions
-            }), 200
+            last = boxes[-1]
+            boxes[-1] = [min(last[0], box[0]), min(last[1], box[1]), max(last[2], box[2]), max(last[3], box[3])]
+    return energy, boxes
+
+def box_positions(result, offset_x=0, offset_y=0):
+    """Converts a YOLO result into position dicts, shifted by a crop offset."""
+    positions = []
+    for box in result.boxes or []:
+        x1, y1, x2, y2 = box.xyxy[0]
+        positions.append({
+            'x1': int(x1.item()) + offset_x,
+            'y1': int(y1.item()) + offset_y,
+            'x2': int(x2.item()) + offset_x,
+            'y2': int(y2.item()) + offset_y
+        })
+    return positions
+
+def overlaps(position, box):
+    """Whether a position dict intersects an [x1, y1, x2, y2] box."""
+    x1, y1, x2, y2 = box
+    return position['x1'] < x2 and position['x2'] > x1 and position['y1'] < y2 and position['y2'] > y1
+
+def current_frame(camera_name):
+    """
+    Returns (version, frame) of the newest frame of a camera, or (None, None).
+
+    Buffered frames use their ingestion sequence number; frames that only
+    exist on disk use the file's modification time.
+    """
+    entry = latest_frame(camera_name)
+    if entry is not None:
+        return f"seq-{entry['sequence']}", entry['image']
+    image_path = vision_path(camera_name)
+    if not os.path.exists(image_path):
+        return None, None
+    return f"mtime-{os.stat(image_path).st_mtime_ns}", cv2.imread(image_path)
+
+def frame_of_version(camera_name, version):
+    """Returns the frame of a version from the ring buffer or the disk, or None if it is gone."""
+    if version.startswith('seq-'):
+        sequence = int(version[len('seq-'):])
+        with frames_lock:
+            for entry in camera_frames.get(camera_name, ()):
+                if entry['sequence'] == sequence:
+                    return entry['image']
+        return None
+    image_path = vision_path(camera_name)
+    if not os.path.exists(image_path) or f"mtime-{os.stat(image_path).st_mtime_ns}" != version:
+        return None
+    return cv2.imread(image_path)
+
+def detect(camera_name):
+    """Runs (or reuses) the detection of a camera's newest frame."""
+    version, frame = current_frame(camera_name)
+    if version is None:
+        return None
+    entry = cached_detection(camera_name, version)
+    if entry is not None:
+        return dict(entry, cached=True)
+
+    height, width = frame.shape[:2]
+    energy, boxes = motion_regions(camera_name, frame)
+    previous = last_detections.get(camera_name)
+    gating = {'motion': boxes != [], 'energy': energy, 'rois': 0, 'pixels_inferred': 0}
+
+    if boxes == [] and previous is not None:
+        # Static scene: keep the last result instead of running the model
+        gating['inference'] = 'skipped'
+        positions = previous['positions']
+    elif boxes and sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in boxes) < MOTION_FULL_FRAME_RATIO * width * height:
+        # Only run the model on the moving regions, batched together
+        crops = [np.ascontiguousarray(frame[y1:y2, x1:x2]) for x1, y1, x2, y2 in boxes]
+        results = inference_worker.submit_many(crops)
+        positions = []
+        for (x1, y1, _, _), result in zip(boxes, results):
+            positions.extend(box_positions(result, x1, y1))
+        # Detections outside the moving regions have not changed since the last result
+        if previous is not None:
+            positions.extend(position for position in previous['positions']
+                             if not any(overlaps(position, box) for box in boxes))
+        gating.update(inference='roi', rois=len(boxes),
+                      pixels_inferred=sum(crop.shape[0] * crop.shape[1] for crop in crops))
+    else:
+        # Perform inference on the whole frame, batched with other cameras' requests
+        positions = box_positions(inference_worker.submit(frame))
+        gating.update(inference='full', pixels_inferred=width * height)
+    gating['compute_saved'] = 1 - gating['pixels_inferred'] / (width * height)
+
+    # Only the boxes are cached; /annotated_image looks the frame up by version
+    entry = {'version': version, 'time': time.time(), 'positions': positions, 'gating': gating}
+    cache_detection(camera_name, version, entry)
+    last_detections[camera_name] = entry
+    return dict(entry, cached=False)
+
+@app.route('/check_image/<camera_name>', methods=['GET'])
+def check_image(camera_name):
+    try:
+        detection = detect(camera_name)
+        if detection is None:
+            return jsonify({'status': 'failure', 'reason': 'Image not found'}), 404
+        return jsonify({
+            'status': 'success',
+            'sus_object_detected': bool(detection['positions']),
+            'annotated_image': f"/annotated_image/{camera_name}?version={detection['version']}",
+            'positions': detection['positions'],
+            'frame_version': detection['version'],
+            'cached': detection['cached'],
+            'gating': detection['gating']
+        }), 200
     except Exception as e:
         print(f"Error checking image: {e}")
         return jsonify({'status': 'error', 'message': 'Failed to check image'}), 400
+
+@app.route('/annotated_image/<camera_name>', methods=['GET'])
+def annotated_image(camera_name):
+    """Draws the detections of a frame version (default: newest) only when asked for."""
+    version = request.args.get('version')
+    if version is None:
+        detection = detect(camera_name)
+    else:
+        detection = cached_detection(camera_name, version)
+    if detection is None:
+        return jsonify({'status': 'failure', 'reason': 'No detection for this frame'}), 404
+    frame = frame_of_version(camera_name, detection['version'])
+    if frame is None:
+        return jsonify({'status': 'failure', 'reason': 'Frame no longer available'}), 404
+    annotated_frame = frame.copy()
+    for box in detection['positions']:
+        cv2.rectangle(annotated_frame, (box['x1'], box['y1']), (box['x2'], box['y2']), (0, 0, 255), 2)
+    started = time.perf_counter()
+    ok, png = cv2.imencode('.png', annotated_frame)
+    encode_latency.observe(time.perf_counter() - started, 'image/png')
+    if not ok:
+        return jsonify({'status': 'error', 'message': 'Failed to render image'}), 500
+    return Response(png.tobytes(), mimetype='image/png')
+
+@app.route('/inference_stats', methods=['GET'])
+def inference_stats():
+    stats = inference_worker.stats()
+    with detection_cache_lock:
+        stats['detection_cache'] = dict(detection_cache_stats, size=len(detection_cache))
+    return jsonify(stats), 200
+
+def state_gauges():
+    """Current size of the in-memory state, computed when /metrics is scraped."""
+    with positions_lock:
+        positions = len(agent_positions)
+    with frames_lock:
+        frames = sum(len(buffer) for buffer in camera_frames.values())
+        frame_bytes = sum(entry['image'].nbytes for buffer in camera_frames.values() for entry in buffer)
+    with detection_cache_lock:
+        cached = len(detection_cache)
+    with subscribers_lock:
+        streams = len(subscribers)
+    return [
+        ('agent_positions', 'Agents with a stored position.', positions),
+        ('frame_buffer_frames', 'Decoded frames held in the ring buffers.', frames),
+        ('frame_buffer_bytes', 'Bytes of decoded frames held in the ring buffers.', frame_bytes),
+        ('detection_cache_entries', 'Cached detections.', cached),
+        ('inference_queue_depth', 'Frames waiting for the inference worker.', inference_worker.pending.qsize()),
+        ('stream_subscribers', 'Connected /stream clients.', streams),
+        ('alarm_alerted', 'Whether the alarm is raised.', int(bool(alarm_status['alarm_alerted']))),
+    ]
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Counters, histograms and state gauges in the Prometheus text format."""
+    lines = []
+    for metric in (http_requests, http_latency, inference_latency, inference_frames,
+                   decode_latency, encode_latency, ingested_bytes, ingested_frames):
+        lines.extend(metric.render())
+    with detection_cache_lock:
+        cache_stats = dict(detection_cache_stats)
+    lines.extend(['# HELP detection_cache_requests_total Detection cache lookups by result.',
+                  '# TYPE detection_cache_requests_total counter',
+                  f'detection_cache_requests_total{{result="hit"}} {cache_stats["hits"]}',
+                  f'detection_cache_requests_total{{result="miss"}} {cache_stats["misses"]}'])
+    for name, help_text, value in state_gauges():
+        lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"])
+    return Response("\n".join(lines) + "\n", mimetype='text/plain; version=0.0.4')
+
 if __name__ == "__main__":
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    app.run(debug=True, host='0.0.0.0', port=5000, threaded=True)
\ No newline at end of file
@@ -0,0 +1,84 @@
+"""Runs several continuations of one SurveillanceModel checkpoint in parallel.
+
+Each branch restores the checkpoint with its own parameter changes, can
+launch extra drones at the checkpoint's step, and runs on. For example, to
+compare the original continuation with a second drone launched at step 500,
+run a model with the parameters checkpointEvery=500 and steps=500, then:
+
+    python fork_runs.py checkpoint_500.ckpt branches.json --steps 1000
+
+with branches.json like
+    [{}, {"drones": 1}, {"parameters": {"seed": 1}, "drones": 1}]
+
+Branches keep the checkpoint's random number generators unless their
+parameters change the seed. One JSON row of results is printed per branch.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from dronerobbersimulationv3 import SurveillanceModel, load_checkpoint
+
+
+def run_branch(job):
+    """Restores the checkpoint for one branch, runs it and returns its results."""
+    index, checkpoint, branch, steps = job
+    parameters = dict({'verbose': False}, **branch.get('parameters', {}))
+    model = SurveillanceModel.restore(checkpoint, parameters)
+    if branch.get('drones'):
+        model.add_drones(branch['drones'], branch.get('stations'))
+    with contextlib.redirect_stdout(io.StringIO()):
+        model.run(steps, display=False)
+    if branch.get('checkpoint'):
+        model.checkpoint(branch['checkpoint'])
+    return {
+        'branch': index,
+        'steps': model.t,
+        'robbers_remaining': len(model.robber),
+        'robber_positions': [list(model.grid.positions[robber]) for robber in model.robber],
+        'drone_positions': [list(model.grid.positions[drone]) for drone in model.drone],
+        'beliefs': len(model.beliefs),
+        'alerts': model.alerts.metrics(),
+    }
+
+
+def fork(checkpoint, branches, steps=None, processes=None):
+    """
+    Runs every branch from the checkpoint and returns their results in order.
+
+    Args:
+        checkpoint (dict or str): A checkpoint or the path of its file.
+        branches (list): One dict per branch, with optional 'parameters'
+            (changes passed to SurveillanceModel.restore; outputs such as
+            'renderOutput' are off unless a branch sets its own path), 'drones' (extra
+            drones to launch), 'stations' (their landing stations) and
+            'checkpoint' (file to save the branch's final state to).
+        steps (int, optional): Steps to run past the checkpoint (default:
+            up to the 'steps' parameter).
+        processes (int, optional): Pool size (default: CPU count); 1 runs in
+            this process.
+    """
+    if isinstance(checkpoint, str):
+        checkpoint = load_checkpoint(checkpoint)
+    jobs = [(index, checkpoint, branch, steps) for index, branch in enumerate(branches)]
+    if processes == 1:
+        return list(map(run_branch, jobs))
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return list(executor.map(run_branch, jobs))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run continuations of a checkpoint in parallel.")
+    parser.add_argument('checkpoint', help="Checkpoint file written by SurveillanceModel.checkpoint")
+    parser.add_argument('branches', help="JSON file with a list of branches")
+    parser.add_argument('--steps', type=int, default=None, help="Steps to run past the checkpoint")
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    with open(args.branches) as f:
+        branches = json.load(f)
+    for result in fork(args.checkpoint, branches, args.steps, args.processes):
+        print(json.dumps(result))
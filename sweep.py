@@ -0,0 +1,189 @@
+"""Headless parameter sweeps over the vectorized engine.
+
+Expands a grid of parameter values (e.g. drone, camera and robber counts,
+world sizes and seeds) into runs, executes them on a process pool and
+streams one row of metrics per run to a columnar file: Parquet when pyarrow
+is installed, otherwise a NumPy .npz archive written at the end. The engines
+run without the Flask server, so no HTTP requests are made.
+
+Example:
+    python sweep.py grid.json results.parquet --processes 8
+
+with grid.json like {"droneAgents": [1, 2, 4], "seed": {"range": 1000}}.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from dronerobbersimulationv3 import parameters
+from tiled_simulation import TiledSurveillanceModel
+from vectorized_simulation import VectorizedSurveillanceModel
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+ENGINES = {
+    'vectorized': VectorizedSurveillanceModel,
+    'tiled': TiledSurveillanceModel,
+}
+
+# Scalar results of VectorizedSurveillanceModel.results() kept per run
+METRICS = [
+    'steps', 'robbers_remaining', 'robbers_captured', 'camera_alerts', 'alerts_merged',
+    'alerts_suppressed', 'drone_alerts', 'alarms', 'first_removal_step', 'drone_distance',
+]
+
+
+def expand_grid(grid, base=None):
+    """
+    Yields one parameters dict per combination of the grid's values.
+
+    Args:
+        grid (dict): Parameter name -> list of values. A value of the form
+            {"range": n} or {"range": [start, stop]} stands for that range.
+        base (dict, optional): Parameters shared by every run
+            (default: the module's `parameters`).
+    """
+    base = parameters if base is None else base
+    keys = list(grid)
+    values = []
+    for key in keys:
+        value = grid[key]
+        if isinstance(value, dict) and 'range' in value:
+            bounds = value['range']
+            value = range(*bounds) if isinstance(bounds, (list, tuple)) else range(bounds)
+        values.append(value)
+    for combination in itertools.product(*values):
+        yield dict(base, **dict(zip(keys, combination)))
+
+
+def flatten(params):
+    """Turns a parameters dict into scalar columns (tuples are split per axis)."""
+    row = {}
+    for key, value in params.items():
+        if isinstance(value, (list, tuple)) and all(np.isscalar(v) for v in value):
+            for axis, item in enumerate(value):
+                row[f"{key}_{axis}"] = item
+        elif np.isscalar(value) or value is None:
+            row[key] = value
+        else:
+            row[key] = json.dumps(value)
+    return row
+
+
+def run_one(job):
+    """Runs one replica and returns its row of parameters and metrics."""
+    run, params, engine = job
+    model = ENGINES[engine](params)
+    start = time.perf_counter()
+    results = model.run()
+    seconds = time.perf_counter() - start
+    row = {'run': run}
+    row.update(flatten(params))
+    row.update({key: results[key] for key in METRICS})
+    row['run_seconds'] = seconds
+    row['step_seconds'] = seconds / max(results['steps'], 1)
+    return row
+
+
+class ColumnWriter:
+    """Collects rows and writes them as Parquet row groups or one .npz archive."""
+
+    def __init__(self, path, batch_size=1024):
+        self.path = path
+        self.batch_size = batch_size
+        self.rows = []
+        self.columns = None
+        self.parquet = path.endswith('.parquet')
+        if self.parquet and pq is None:
+            raise ImportError("Writing Parquet requires pyarrow; use a .npz output instead.")
+        self.writer = None
+        self.chunks = []  # Column dicts of the flushed batches, for .npz output
+
+    def append(self, row):
+        if self.columns is None:
+            self.columns = list(row)
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        columns = {key: [row.get(key) for row in self.rows] for key in self.columns}
+        self.rows = []
+        if self.parquet:
+            table = pa.table(columns)
+            if self.writer is None:
+                self.writer = pq.ParquetWriter(self.path, table.schema)
+            self.writer.write_table(table)
+        else:
+            self.chunks.append(columns)
+
+    def close(self):
+        self.flush()
+        if self.parquet:
+            if self.writer is not None:
+                self.writer.close()
+        elif self.chunks:
+            np.savez_compressed(self.path, **{
+                key: np.array([value for chunk in self.chunks for value in chunk[key]])
+                for key in self.columns
+            })
+
+
+def run_sweep(grid, output, engine='vectorized', processes=None, base=None, batch_size=1024):
+    """
+    Runs every combination of the grid and writes one row per run to `output`.
+
+    Args:
+        grid (dict): See `expand_grid`.
+        output (str): Path ending in .parquet or .npz.
+        engine (str): 'vectorized' or 'tiled'.
+        processes (int, optional): Pool size (default: CPU count); 1 runs in
+            this process.
+        base (dict, optional): Parameters shared by every run.
+        batch_size (int): Rows per Parquet row group.
+
+    Returns:
+        int: The number of runs.
+    """
+    jobs = ((run, params, engine) for run, params in enumerate(expand_grid(grid, base)))
+    writer = ColumnWriter(output, batch_size)
+    count = 0
+    try:
+        if processes == 1:
+            for row in map(run_one, jobs):
+                writer.append(row)
+                count += 1
+        else:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                for row in executor.map(run_one, jobs, chunksize=16):
+                    writer.append(row)
+                    count += 1
+    finally:
+        writer.close()
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a headless parameter sweep.")
+    parser.add_argument('grid', help="JSON file mapping parameter names to lists of values")
+    parser.add_argument('output', help="Output file, .parquet or .npz")
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='vectorized')
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    with open(args.grid) as f:
+        grid = json.load(f)
+    start = time.perf_counter()
+    count = run_sweep(grid, args.output, args.engine, args.processes)
+    print(f"{count} runs written to {args.output} in {time.perf_counter() - start:.1f} s")
@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+import requests
+
+# The simulation modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def no_flask_server(monkeypatch):
+    """Makes every HTTP call fail fast, as when the Flask server is not running."""
+    def refuse(*args, **kwargs):
+        raise requests.exceptions.ConnectionError()
+    for name in ('get', 'post'):
+        monkeypatch.setattr(requests, name, refuse)
+        monkeypatch.setattr(requests.Session, name, refuse)
@@ -0,0 +1,251 @@
+"""Equivalence checks between the engines and tools built on SurveillanceModel."""
+
+import contextlib
+import io
+import itertools
+from collections import deque
+
+import numpy as np
+import pytest
+
+import camera_placement
+import dronerobbersimulationv3 as sim
+import fork_runs
+import sweep
+import trace_replay
+from tiled_simulation import TiledSurveillanceModel
+from vectorized_simulation import VectorizedSurveillanceModel
+
+STATIONS = [(50, 50), (20, 80), (80, 20)]
+
+
+def run_parameters(seed, **changes):
+    """A small run whose agent counts and options vary with the seed."""
+    params = dict(
+        sim.parameters, seed=seed, steps=60, verbose=False,
+        robberAgents=1 + seed % 4, droneAgents=1 + seed % 4, cameraAgents=3 + seed % 3,
+        landingStations=STATIONS[:1 + seed % 3], sparseGrid=seed % 2 == 0,
+        alertMergeWindow=seed % 4, alertSuppressSteps=seed % 3,
+    )
+    params.update(changes)
+    return params
+
+
+def run_model(model, steps=None):
+    with contextlib.redirect_stdout(io.StringIO()):
+        model.run(steps, display=False)
+    return model
+
+
+def model_state(model):
+    """What the next steps of a model depend on, for comparing runs."""
+    metrics = {alert_type: {key: value for key, value in stats.items() if 'seconds' not in key}
+               for alert_type, stats in model.alerts.metrics().items()}
+    return (
+        model.t,
+        sorted(model.grid.positions[robber] for robber in model.robber),
+        [model.grid.positions[drone] for drone in model.drone],
+        [(drone.intention, list(drone.plan_steps), drone.alert_sent, drone.patrol_mode) for drone in model.drone],
+        len(model.beliefs),
+        metrics,
+        model.random.random(),
+    )
+
+
+@pytest.mark.parametrize('seed', range(8))
+def test_vectorized_engine_matches_agentpy(seed):
+    params = run_parameters(seed, cameraPositions=[(25, 27), (76, 71), (75, 23), (10, 90)] if seed % 3 == 0 else None)
+    model = run_model(sim.SurveillanceModel(params))
+    results = VectorizedSurveillanceModel(params).run()
+    assert sorted(results['robber_positions']) == sorted(model.grid.positions[robber] for robber in model.robber)
+    assert results['drone_positions'] == [model.grid.positions[drone] for drone in model.drone]
+
+
+@pytest.mark.parametrize('seed', range(6))
+def test_restore_matches_uninterrupted_run(seed, tmp_path):
+    params = run_parameters(seed)
+    uninterrupted = run_model(sim.SurveillanceModel(params))
+    interrupted = run_model(sim.SurveillanceModel(params), steps=5 + seed * 7 % 50)
+    path = str(tmp_path / 'run.ckpt')
+    interrupted.checkpoint(path)
+    restored = run_model(sim.SurveillanceModel.restore(path))
+    assert model_state(restored) == model_state(uninterrupted)
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_tile_layouts_agree(seed):
+    params = run_parameters(seed, robberAgents=1 + seed * 3 % 40, steps=80)
+    results = [TiledSurveillanceModel(dict(params, tiles=tiles, tileProcesses=False)).run()
+               for tiles in [(1, 1), (2, 2), (3, 2), (5, 7)]]
+    assert all(result == results[0] for result in results[1:])
+
+
+def test_tile_processes_match_local_tiles():
+    params = run_parameters(3, robberAgents=12, steps=80, tiles=(2, 2))
+    local = TiledSurveillanceModel(dict(params, tileProcesses=False)).run()
+    assert TiledSurveillanceModel(dict(params, tileProcesses=True)).run() == local
+
+
+def test_forks_do_not_depend_on_process_count(tmp_path):
+    params = dict(sim.parameters, seed=4, robberAgents=3, steps=30, checkpointEvery=10,
+                  checkpointPath=str(tmp_path / 'run_{step}.ckpt'), verbose=False)
+    run_model(sim.SurveillanceModel(params))
+    branches = [{}, {'drones': 1}, {'parameters': {'seed': 1}, 'drones': 1}]
+    checkpoint = str(tmp_path / 'run_10.ckpt')
+
+    def without_alert_timings(results):
+        return [{key: value for key, value in result.items() if key != 'alerts'} for result in results]
+
+    serial = fork_runs.fork(checkpoint, branches, steps=60, processes=1)
+    parallel = fork_runs.fork(checkpoint, branches, steps=60, processes=2)
+    assert without_alert_timings(parallel) == without_alert_timings(serial)
+
+
+def test_trace_replay_prints_the_live_messages(tmp_path):
+    params = dict(sim.parameters, seed=3, robberAgents=2, droneAgents=2)
+    live = io.StringIO()
+    with contextlib.redirect_stdout(live):
+        sim.SurveillanceModel(params).run(display=False)
+    path = str(tmp_path / 'run.trace')
+    model = run_model(sim.SurveillanceModel(dict(params, tracePath=path, traceCapacity=64, verbose=False)))
+    records, payloads = sim.read_trace(path)
+    assert len(records) == model.trace.total
+    replayed = io.StringIO()
+    with contextlib.redirect_stdout(replayed):
+        trace_replay.print_trace(records, payloads)
+    # Connection failures depend on the server, not on the run
+    def messages(output):
+        return sorted(line for line in output.getvalue().splitlines()
+                      if line not in ("Failed to connect to the Flask server.", "Simulation completed!"))
+
+    assert messages(replayed) == messages(live)
+
+
+def test_trace_replay_ends_at_the_sent_positions(tmp_path, monkeypatch):
+    sent = {}
+    send = sim.TelemetryClient.send
+
+    def record(self, agent_type, agent_id, position):
+        sent[agent_id] = (agent_type, tuple(position))
+        return send(self, agent_type, agent_id, position)
+
+    monkeypatch.setattr(sim.TelemetryClient, 'send', record)
+    path = str(tmp_path / 'run.trace')
+    model = run_model(sim.SurveillanceModel(dict(sim.parameters, seed=3, robberAgents=3, droneAgents=2,
+                                                 tracePath=path, verbose=False)))
+    step, agents = deque(trace_replay.snapshots(*sim.read_trace(path)), maxlen=1)[0]
+    assert step == model.t
+    # Agents that never moved keep the position they were placed at
+    expected = {agent.id: sent.get(agent.id, (agent_type, model.grid.positions[agent]))
+                for name, (_, agent_type) in sim.AGENT_LISTS.items() for agent in getattr(model, name)}
+    assert agents == expected
+
+
+def test_sweep_rows_match_engine_runs(tmp_path):
+    output = str(tmp_path / 'sweep.npz')
+    grid = {'droneAgents': [1, 2], 'seed': {'range': 3}}
+    assert sweep.run_sweep(grid, output, processes=1, base=dict(sim.parameters, steps=40)) == 6
+    with np.load(output) as rows:
+        for run, params in enumerate(sweep.expand_grid(grid, dict(sim.parameters, steps=40))):
+            results = VectorizedSurveillanceModel(params).run()
+            assert {key: rows[key][run] for key in sweep.METRICS} == {key: results[key] for key in sweep.METRICS}
+
+
+def test_layout_coverage_matches_coverage_map():
+    rng = np.random.default_rng(0)
+    world_size = (60, 45)
+    layouts = rng.integers(0, world_size, (4, 5, 2))
+    counts = camera_placement.coverage_counts(layouts, world_size)
+    for layout, layout_counts in zip(layouts, counts):
+        coverage = sim.CoverageMap(world_size, layout.tolist(), camera_placement.CAMERA_DETECTION_RANGE)
+        expected = [[len(coverage.cameras_at((x, y))) for y in range(world_size[1])] for x in range(world_size[0])]
+        assert layout_counts.tolist() == expected
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_coverage_tiles_match_bitset(seed, monkeypatch):
+    rng = np.random.default_rng(seed)
+    shape = tuple(rng.integers(1, 200, 2).tolist())
+    detection_range = int(rng.integers(0, 20))
+    cameras = [tuple(position) for position in rng.integers(0, shape, (rng.integers(1, 30), 2)).tolist()]
+    positions = rng.integers(0, shape, (80, 2))
+    bitset = sim.CoverageMap(shape, cameras, detection_range)
+    monkeypatch.setattr(sim, 'SPARSE_GRID_CELLS', 0)
+    tiled = sim.CoverageMap(shape, cameras, detection_range)
+    assert bitset.tiles is None and tiled.tiles is not None
+    assert tiled.detect(positions).tolist() == bitset.detect(positions).tolist()
+    for position in positions[:10]:
+        assert tiled.cameras_at(position).tolist() == bitset.cameras_at(position).tolist()
+
+
+def shortest_distance(planner, start, goal):
+    """Breadth-first distance over the 8-connected free cells, None if unreachable."""
+    distance = {start: 0}
+    frontier = deque([start])
+    while frontier:
+        cell = frontier.popleft()
+        if cell == goal:
+            return distance[cell]
+        for dx, dy in sim.MOVES:
+            neighbor = (cell[0] + dx, cell[1] + dy)
+            if planner.in_bounds(neighbor) and neighbor not in planner.blocked and neighbor not in distance:
+                distance[neighbor] = distance[cell] + 1
+                frontier.append(neighbor)
+    return None
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_a_star_paths_are_shortest(seed):
+    rng = np.random.default_rng(seed)
+    shape = (30, 25)
+    zones = [(x, y, x + int(w), y + int(h)) for x, y, w, h in
+             zip(*rng.integers(0, 25, (2, 8)), *rng.integers(0, 6, (2, 8)))]
+    planner = sim.PathPlanner(shape, sim.PathPlanner.no_fly_cells(zones))
+    free = [cell for cell in itertools.product(range(shape[0]), range(shape[1])) if cell not in planner.blocked]
+    for start_index, goal_index in rng.integers(0, len(free), (20, 2)):
+        start, goal = free[start_index], free[goal_index]
+        steps = planner.search(start, goal)
+        distance = shortest_distance(planner, start, goal)
+        if distance is None:
+            assert steps is None
+            continue
+        assert len(steps) == distance
+        cell = start
+        for dx, dy in steps:
+            assert (dx, dy) in sim.MOVES
+            cell = (cell[0] + dx, cell[1] + dy)
+            assert planner.in_bounds(cell) and cell not in planner.blocked
+        assert cell == goal
+        assert len(planner.plan(start, goal)) == distance
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_greedy_assignment_takes_nearest_free_drone(seed):
+    rng = np.random.default_rng(seed)
+    width = int(rng.integers(1, 40))
+    drones = rng.integers(0, width, (rng.integers(1, 80), 2))
+    alerts = rng.integers(0, width, (rng.integers(1, 80), 2))
+    if seed % 3 == 0:
+        drones[:] = drones[0]  # The whole fleet at one landing station
+    assigned = {alert: drone for drone, alert in sim.greedy_assign(drones, alerts)}
+    free = set(range(len(drones)))
+    for alert, position in enumerate(alerts):
+        if not free:
+            assert alert not in assigned
+            continue
+        nearest = min(np.abs(drones[drone] - position).max() for drone in free)
+        drone = assigned[alert]
+        assert drone in free and np.abs(drones[drone] - position).max() == nearest
+        free.remove(drone)
+
+
+def test_exact_assignment_minimizes_total_travel():
+    rng = np.random.default_rng(0)
+    drones = rng.integers(0, 50, (5, 2))
+    alerts = rng.integers(0, 50, (4, 2))
+    cost = np.abs(drones[:, None, :] - alerts[None, :, :]).max(axis=2)
+    pairs = sim.assign_alerts(drones, alerts)
+    best = min(sum(cost[drone, alert] for alert, drone in enumerate(chosen))
+               for chosen in itertools.permutations(range(len(drones)), len(alerts)))
+    assert len(pairs) == len(alerts)
+    assert sum(cost[drone, alert] for drone, alert in pairs) == best
@@ -0,0 +1,344 @@
+"""Domain-decomposed, multi-process variant of the vectorized engine.
+
+The world is split into rectangular tiles, each owned by a worker process
+that keeps the robbers standing on it. Every step runs behind two barriers:
+
+1. Workers apply the removals decided in the previous step, move their
+   robbers and report those that left the tile (hand-off) together with
+   those close enough to an edge to matter to a neighbour (halo).
+2. Workers take in the robbers handed to them and, using the halo, answer
+   the camera and drone range queries for the cameras and drones on their
+   tile.
+
+Drones, camera events, dispatch and security stay in the coordinating
+process, as they involve few agents and global decisions. Robber moves come
+from a counter-based hash of (seed, step, robber), so a run only depends on
+the seed and never on the tile layout or process scheduling.
+"""
+
+import multiprocessing
+
+import numpy as np
+
+from dronerobbersimulationv3 import CoverageMap, parameters
+from vectorized_simulation import (
+    CAMERA_DETECTION_RANGE, DRONE_DETECTION_RANGE, ROBBER_DIRECTIONS, VectorizedSurveillanceModel
+)
+
+# Width of the band along tile edges whose robbers are shared with neighbours
+HALO = max(CAMERA_DETECTION_RANGE, DRONE_DETECTION_RANGE)
+
+
+def robber_moves(key, step, ids):
+    """
+    Move of each robber for a step, drawn from a splitmix64 hash of
+    (key, step, robber id) so that it does not depend on who computes it.
+    """
+    x = ids.astype(np.uint64) | (np.full(len(ids), step, dtype=np.uint64) << np.uint64(32))
+    x ^= np.uint64(key)
+    x += np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    x ^= x >> np.uint64(31)
+    return ROBBER_DIRECTIONS[(x % np.uint64(len(ROBBER_DIRECTIONS))).astype(np.int64)]
+
+
+def in_box(positions, low, high):
+    """Mask of the positions inside the half-open box [low, high)."""
+    return np.all((positions >= low) & (positions < high), axis=1)
+
+
+class Tile:
+    """The robbers, cameras and range queries of one rectangle of the world."""
+
+    def __init__(self, low, high, world_size, camera_ids, camera_positions, key):
+        self.low = np.array(low)
+        self.high = np.array(high)
+        self.world_size = np.array(world_size)
+        self.key = key
+        self.camera_ids = np.array(camera_ids, dtype=np.int64)
+        self.coverage = CoverageMap(world_size, camera_positions, CAMERA_DETECTION_RANGE)
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.pos = np.zeros((0, 2), dtype=np.int64)
+
+    def add(self, ids, positions):
+        self.ids = np.concatenate([self.ids, ids])
+        self.pos = np.concatenate([self.pos, np.asarray(positions, dtype=np.int64).reshape(-1, 2)])
+
+    def keep(self, mask):
+        self.ids, self.pos = self.ids[mask], self.pos[mask]
+
+    def remove(self, kills, removals):
+        """
+        Drops captured robbers, then the first robber at each removal location.
+
+        Args:
+            kills (list): Ids of robbers captured by drones.
+            removals (list): Locations where security removes a robber.
+
+        Returns:
+            list: Ids removed at the locations.
+        """
+        self.keep(~np.isin(self.ids, kills))
+        removed = []
+        for location in removals:
+            at_location = np.flatnonzero((self.pos == location).all(axis=1))
+            if at_location.size:
+                first = at_location[np.argmin(self.ids[at_location])]
+                removed.append(int(self.ids[first]))
+                self.keep(np.arange(len(self.ids)) != first)
+        return removed
+
+    def advance(self, step, kills, removals):
+        """
+        Applies removals, moves the robbers one step and splits off those that left.
+
+        Returns:
+            tuple: (ids removed at the locations, leaving ids, their positions,
+            halo ids, their positions).
+        """
+        removed = self.remove(kills, removals)
+        self.pos = np.clip(self.pos + robber_moves(self.key, step, self.ids), 0, self.world_size - 1)
+        owned = in_box(self.pos, self.low, self.high)
+        leaving = (self.ids[~owned], self.pos[~owned])
+        self.keep(owned)
+
+        band = ~in_box(self.pos, self.low + HALO, self.high - HALO)
+        return (removed,) + leaving + (self.ids[band], self.pos[band])
+
+    def detect(self, ids, positions, halo_ids, halo_positions, drones):
+        """
+        Takes in the robbers handed to this tile and answers its range queries.
+
+        Args:
+            ids, positions: Robbers that moved onto this tile.
+            halo_ids, halo_positions: Neighbours' robbers near this tile.
+            drones (list): (drone index, position) of the drones on this tile.
+
+        Returns:
+            tuple: {camera index: (robber id, position)} for cameras that see a
+            robber, and {drone index: [(cell key, robber id, position)]} with
+            every robber in range of each drone.
+        """
+        self.add(ids, positions)
+        all_ids = np.concatenate([self.ids, halo_ids])
+        all_pos = np.concatenate([self.pos, np.asarray(halo_positions, dtype=np.int64).reshape(-1, 2)])
+        # Same tie-break as the single-process engine: lowest robber id first
+        order = np.argsort(all_ids, kind='stable')
+        all_ids, all_pos = all_ids[order], all_pos[order]
+
+        cameras = {}
+        for camera, found in zip(self.camera_ids, self.coverage.detect(all_pos)):
+            if found >= 0:
+                cameras[int(camera)] = (int(all_ids[found]), all_pos[found])
+
+        sightings = {}
+        for drone, position in drones:
+            near = np.flatnonzero(np.all(np.abs(all_pos - position) <= DRONE_DETECTION_RANGE, axis=1))
+            keys = all_pos[near, 0] * self.world_size[1] + all_pos[near, 1]
+            sightings[drone] = sorted(zip(keys.tolist(), all_ids[near].tolist(), all_pos[near]),
+                                      key=lambda item: item[:2])
+        return cameras, sightings
+
+    def robbers(self):
+        return self.ids, self.pos
+
+
+def run_tile(connection, tile):
+    """Worker process loop: runs Tile methods on request until told to close."""
+    while True:
+        command, args = connection.recv()
+        if command == 'close':
+            break
+        connection.send(getattr(tile, command)(*args))
+    connection.close()
+
+
+class LocalTile:
+    """Runs a Tile in the coordinating process behind the same interface as a worker."""
+
+    def __init__(self, tile):
+        self.tile = tile
+        self.result = None
+
+    def send(self, message):
+        command, args = message
+        self.result = None if command == 'close' else getattr(self.tile, command)(*args)
+
+    def recv(self):
+        return self.result
+
+
+class TiledSurveillanceModel(VectorizedSurveillanceModel):
+    """
+    VectorizedSurveillanceModel with the robbers spread over tile worker processes.
+
+    Parameters, on top of the engine's:
+        tiles (tuple): Number of tiles along x and y (default (2, 2)).
+        tileProcesses (bool): Run each tile in its own process (default True);
+            False runs them in this process, with identical results.
+    """
+
+    def setup(self, seed=None):
+        super().setup(seed)
+        self.robber_key = self.random.getrandbits(64)
+        nx, ny = self.p.get('tiles', (2, 2))
+        xs = np.linspace(0, self.world_size[0], nx + 1).astype(np.int64)
+        ys = np.linspace(0, self.world_size[1], ny + 1).astype(np.int64)
+        self.tile_bounds = [((xs[i], ys[j]), (xs[i + 1], ys[j + 1])) for i in range(nx) for j in range(ny)]
+        self.tile_x, self.tile_y = xs, ys
+
+        camera_tiles = self.tile_of(self.camera_pos)
+        robber_tiles = self.tile_of(self.robber_pos)
+        ids = np.arange(len(self.robber_pos))
+        self.workers = []
+        self.processes = []
+        context = multiprocessing.get_context()
+        for index, (low, high) in enumerate(self.tile_bounds):
+            cameras = np.flatnonzero(camera_tiles == index)
+            tile = Tile(low, high, self.world_size, cameras, self.camera_pos[cameras].tolist(), self.robber_key)
+            mine = robber_tiles == index
+            tile.add(ids[mine], self.robber_pos[mine])
+            if self.p.get('tileProcesses', True):
+                connection, worker_connection = context.Pipe()
+                process = context.Process(target=run_tile, args=(worker_connection, tile), daemon=True)
+                process.start()
+                worker_connection.close()
+                self.workers.append(connection)
+                self.processes.append(process)
+            else:
+                self.workers.append(LocalTile(tile))
+
+        # Positions now live in the tiles; the coordinator only keeps what
+        # the current step's queries reported
+        self.robber_pos = None
+        self.sighted = {}  # robber id -> position reported this step
+        self.drone_candidates = {}  # drone index -> robbers in range, in cell order
+        self.camera_hits = {}
+        self.kills = []  # Ids of robbers captured by drones this step
+        self.removals = []  # Locations where security removes a robber
+
+    def tile_of(self, positions):
+        """Index of the tile holding each position."""
+        positions = np.asarray(positions).reshape(-1, 2)
+        i = np.searchsorted(self.tile_x, positions[:, 0], side='right') - 1
+        j = np.searchsorted(self.tile_y, positions[:, 1], side='right') - 1
+        return i * (len(self.tile_y) - 1) + j
+
+    def broadcast(self, command, per_tile_args):
+        """Sends one request to every tile and waits for all replies (the step barrier)."""
+        for worker, args in zip(self.workers, per_tile_args):
+            worker.send((command, args))
+        return [worker.recv() for worker in self.workers]
+
+    def pending_removals(self):
+        """
+        Per-tile arguments for the removals decided since the last exchange.
+
+        A captured robber may have left the range it was believed in, so kills
+        go to every tile; security removals go to the tile of their location.
+        """
+        removals = [[] for _ in self.workers]
+        for location in self.removals:
+            removals[self.tile_of(location)[0]].append(location)
+        kills = self.kills
+        self.kills, self.removals = [], []
+        return [(kills, tile_removals) for tile_removals in removals]
+
+    def apply_removals(self):
+        """Applies pending removals on the tiles without moving the robbers."""
+        for removed in self.broadcast('remove', self.pending_removals()):
+            self.robber_alive[removed] = False
+            if removed:
+                self.record_removal(self.t)
+
+    def exchange(self):
+        """Moves the robbers on every tile, hands them off and runs the range queries."""
+        replies = self.broadcast('advance', [(self.t,) + args for args in self.pending_removals()])
+        for removed, *_ in replies:
+            self.robber_alive[removed] = False
+            if removed:
+                self.record_removal(self.t - 1)  # Decided by security last step
+
+        leaving_ids = np.concatenate([reply[1] for reply in replies])
+        leaving_pos = np.concatenate([reply[2] for reply in replies])
+        # Robbers that just changed tiles may also be near a third tile
+        band_ids = np.concatenate([reply[3] for reply in replies] + [leaving_ids])
+        band_pos = np.concatenate([reply[4] for reply in replies] + [leaving_pos])
+        leaving_tiles = self.tile_of(leaving_pos)
+        drone_tiles = self.tile_of(self.drone_pos)
+        detect_args = []
+        for index, (low, high) in enumerate(self.tile_bounds):
+            arriving = leaving_tiles == index
+            near = in_box(band_pos, np.array(low) - HALO, np.array(high) + HALO) & ~in_box(band_pos, low, high)
+            drones = [(drone, self.drone_pos[drone].copy()) for drone in np.flatnonzero(drone_tiles == index)]
+            detect_args.append((leaving_ids[arriving], leaving_pos[arriving], band_ids[near], band_pos[near], drones))
+
+        self.camera_hits = {}
+        self.drone_candidates = {}
+        self.sighted = {}
+        for cameras, sightings in self.broadcast('detect', detect_args):
+            self.camera_hits.update(cameras)
+            self.drone_candidates.update(sightings)
+            for robber, position in cameras.values():
+                self.sighted[robber] = position
+            for candidates in sightings.values():
+                for _, robber, position in candidates:
+                    self.sighted[robber] = position
+
+    def step_robbers(self):
+        self.exchange()
+
+    def step_cameras(self):
+        """Queues a camera alert for each camera whose tile reported a robber in range."""
+        self.nprandom.random(len(self.camera_pos))
+        for camera in range(len(self.camera_pos)):
+            if camera in self.camera_hits:
+                self.camera_alerts_sent[camera] += 1
+                self.publish_camera_alert(self.camera_hits[camera][0])
+
+    def robber_position(self, robber):
+        return np.array(self.sighted[robber])
+
+    def drone_sightings(self):
+        seen = np.full(len(self.drone_pos), -1, dtype=np.int64)
+        for drone, candidates in self.drone_candidates.items():
+            seen[drone] = next((robber for _, robber, _ in candidates if self.robber_alive[robber]), -1)
+        return seen
+
+    def capture_robber(self, robber):
+        if not super().capture_robber(robber):
+            return False
+        self.kills.append(robber)
+        return True
+
+    def remove_robber_at(self, location):
+        # Applied by the owning tile before its robbers move on the next step
+        self.removals.append(np.array(location))
+
+    def robber_positions(self):
+        """Positions of the remaining robbers, gathered from the tiles in robber order."""
+        self.apply_removals()
+        replies = self.broadcast('robbers', [()] * len(self.workers))
+        ids = np.concatenate([ids for ids, _ in replies])
+        positions = np.concatenate([positions for _, positions in replies])
+        return positions[np.argsort(ids)]
+
+    def close(self):
+        """Stops the tile workers."""
+        for worker in self.workers:
+            worker.send(('close', ()))
+        for process in self.processes:
+            process.join()
+        self.workers, self.processes = [], []
+
+    def run(self, steps=None, seed=None):
+        try:
+            return super().run(steps, seed)
+        finally:
+            self.close()
+
+
+if __name__ == "__main__":
+    model = TiledSurveillanceModel(parameters)
+    print(model.run())
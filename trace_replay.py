@@ -0,0 +1,145 @@
+"""Replays an event trace written by SurveillanceModel.
+
+Run the model with a `tracePath` parameter (and `verbose=False` for a quiet
+run), then:
+
+    python trace_replay.py run.trace --print            # the console messages
+    python trace_replay.py run.trace --print moved captured
+    python trace_replay.py run.trace --unity --delay 0.5  # re-send positions to Unity
+    python trace_replay.py run.trace --plot replay.gif   # grid animation
+
+Replays read the trace only; the simulation is not run again.
+"""
+
+import argparse
+import time
+
+import numpy as np
+import requests
+
+from dronerobbersimulationv3 import EVENT_CODES, EVENT_KINDS, format_event, read_trace
+
+KIND_NAMES = list(EVENT_KINDS)
+
+# agent_type values of the agents, as in animation_plot
+AGENT_TYPES = {'Drone': 0, 'Camera': 1, 'Robber': 2, 'Security': 3}
+
+
+def events(records, payloads, kinds=None):
+    """Yields (step, kind, agent, (x, y), text) for the records, optionally only some kinds."""
+    if kinds is not None:
+        records = records[np.isin(records['kind'], [EVENT_CODES[kind] for kind in kinds])]
+    for step, agent, code, x, y, payload in records.tolist():
+        yield step, KIND_NAMES[code], agent, (x, y), payloads[payload] if payload >= 0 else None
+
+
+def print_trace(records, payloads, kinds=None):
+    """Prints the console messages of the events, like a verbose run."""
+    if kinds is None:
+        kinds = [kind for kind, message in EVENT_KINDS.items() if message]
+    for _, kind, _, position, text in events(records, payloads, kinds):
+        print(format_event(kind, position, text))
+
+
+def snapshots(records, payloads):
+    """
+    Yields the agent positions of each step, as they were sent to Unity.
+
+    Yields:
+        tuple: (step, {agent_id: (agent type, (x, y))}) from setup to the
+            last step. The dict is updated in place between steps.
+    """
+    agents = {}
+    tracked = [EVENT_CODES[kind] for kind in ('placed', 'position', 'removed', 'robber_removed')]
+    records = records[np.isin(records['kind'], tracked)]
+    if len(records) == 0:
+        return
+    # Records are in step order; split them at every change of step
+    bounds = np.flatnonzero(np.diff(records['step'])) + 1
+    for chunk in np.split(records, bounds):
+        for step, kind, agent, position, text in events(chunk, payloads):
+            if kind == 'placed':
+                agents[agent] = (text, position)
+            elif kind == 'position':
+                agents[agent] = (agents[agent][0], position)
+            else:
+                agents.pop(agent, None)
+        yield int(chunk['step'][0]), agents
+
+
+def world_size(records):
+    """The grid size recorded at setup."""
+    world = records[records['kind'] == EVENT_CODES['world']]
+    return int(world['x'][0]), int(world['y'][0])
+
+
+def replay_unity(records, payloads, url='http://localhost:5000/update_positions', delay=1.0):
+    """Posts the positions of every step to the Flask server, `delay` seconds apart."""
+    session = requests.Session()
+    for step, agents in snapshots(records, payloads):
+        positions = [
+            {'agent_type': agent_type, 'agent_id': agent_id, 'position': list(position)}
+            for agent_id, (agent_type, position) in agents.items()
+        ]
+        try:
+            response = session.post(url, json={'step': step, 'positions': positions}, timeout=2.0)
+            if response.status_code != 200:
+                print(f"Failed to send positions for step {step}.")
+        except requests.exceptions.RequestException:
+            print("Failed to connect to the Flask server.")
+            return
+        time.sleep(delay)
+
+
+def agent_type_grids(records, payloads):
+    """Yields (step, agent_type grid) per step, NaN in empty cells."""
+    shape = world_size(records)
+    for step, agents in snapshots(records, payloads):
+        grid = np.full(shape, np.nan)
+        for agent_type, (x, y) in agents.values():
+            grid[x, y] = AGENT_TYPES[agent_type]
+        yield step, grid
+
+
+def replay_plot(records, payloads, output=None, interval=200):
+    """Animates the grid like animation_plot; saved to `output` or shown."""
+    import agentpy as ap
+    import matplotlib.pyplot as plt
+    from matplotlib.animation import FuncAnimation
+
+    frames = list(agent_type_grids(records, payloads))
+    fig, ax = plt.subplots(figsize=(8, 8))
+
+    def draw(frame):
+        step, grid = frame
+        ax.clear()
+        ap.gridplot(grid, cmap='Accent', ax=ax)
+        ax.set_title(f"Surveillance Simulation \n Time-step: {step}")
+
+    animation = FuncAnimation(fig, draw, frames=frames, interval=interval)
+    if output:
+        animation.save(output)
+    else:
+        plt.show()
+    return animation
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a surveillance event trace.")
+    parser.add_argument('trace', help="Trace file written with the tracePath parameter")
+    parser.add_argument('--print', nargs='*', metavar='KIND', dest='kinds',
+                        help="Print the console messages, optionally only these event kinds")
+    parser.add_argument('--unity', action='store_true', help="Re-send the positions to the Flask server")
+    parser.add_argument('--url', default='http://localhost:5000/update_positions')
+    parser.add_argument('--delay', type=float, default=1.0, help="Seconds between steps sent to Unity")
+    parser.add_argument('--plot', nargs='?', const='', metavar='OUTPUT',
+                        help="Animate the grid, saved to OUTPUT (e.g. replay.gif) or shown")
+    args = parser.parse_args()
+
+    records, payloads = read_trace(args.trace)
+    if args.kinds is not None:
+        print_trace(records, payloads, args.kinds or None)
+    if args.unity:
+        replay_unity(records, payloads, args.url, args.delay)
+    if args.plot is not None:
+        replay_plot(records, payloads, args.plot or None)
@@ -0,0 +1,343 @@
+"""Vectorized headless engine for the drone/robber surveillance simulation.
+
+Runs the same rules as `SurveillanceModel` in dronerobbersimulationv3.py, but
+keeps every agent's position and state in NumPy arrays so that robbers, camera
+detection and plan execution advance in batched array operations. It is driven
+by the same parameters dict, draws its random numbers in the same order as the
+agentpy agents, and therefore reproduces the agentpy run for a fixed seed.
+Nothing is sent to the Flask server.
+"""
+
+import random
+
+import numpy as np
+
+from dronerobbersimulationv3 import SECURITY_POSITION, CoverageMap, SurveillanceModel, assign_alerts, parameters
+
+# Same direction lists, in the same order, as Robber.move_randomly and
+# DroneAgent.take_random_step
+ROBBER_DIRECTIONS = np.array([(1, 0), (-1, 0), (0, 1), (0, -1), (0, 0)])
+DRONE_DIRECTIONS = np.array([(1, 0), (-1, 0), (0, 1), (0, -1)])
+
+DRONE_DETECTION_RANGE = 10
+CAMERA_DETECTION_RANGE = 18
+
+# Cap on the size of a (centers x robbers) distance block held in memory
+CHUNK_CELLS = 4_000_000
+
+
+class VectorizedSurveillanceModel:
+    """Array-based counterpart of SurveillanceModel for large headless runs."""
+
+    def __init__(self, parameters):
+        self.p = dict(parameters)
+        self.t = 0
+        self.running = False
+
+    def setup(self, seed=None):
+        """Initialize the agent arrays and seed the generators like agentpy does."""
+        if seed is None:
+            seed = self.p.get('seed', random.getrandbits(128))
+        self.random = random.Random(seed)
+        self.nprandom = np.random.default_rng(seed=self.random.getrandbits(128))
+
+        if self.p.get('noFlyZones'):
+            raise ValueError("The vectorized engine plans straight paths and does not support noFlyZones.")
+        self.world_size = np.array(self.p['worldSize'])
+        width, height = self.p['worldSize']
+        drone_count = self.p['droneAgents']
+        robber_count = self.p['robberAgents']
+
+        # Robbers: random cells with repetition, as Grid.add_agents(random=True)
+        cells = self.random.choices(range(width * height), k=robber_count)
+        cells = np.array(cells, dtype=np.int64)
+        self.robber_pos = np.stack([cells // height, cells % height], axis=1)
+        self.robber_alive = np.ones(robber_count, dtype=bool)
+
+        # Cameras never move
+        camera_positions = SurveillanceModel.camera_layout(self.p)
+        SurveillanceModel.check_positions('Camera', camera_positions, (width, height))
+        SurveillanceModel.check_positions('Security', [SECURITY_POSITION], (width, height))
+        self.camera_pos = np.array(camera_positions, dtype=np.int64)
+        self.camera_alerts_sent = np.zeros(len(self.camera_pos), dtype=np.int64)
+        self.coverage = CoverageMap((width, height), camera_positions, CAMERA_DETECTION_RANGE)
+
+        # Drones start on their landing station. An empty plan is a target
+        # equal to the current position, since plans are straight lines that
+        # the drone follows one cell per step.
+        stations = SurveillanceModel.landing_stations(self.p, (width, height))
+        SurveillanceModel.check_positions('Landing station', stations, (width, height))
+        self.landing_pos = np.array([stations[i % len(stations)] for i in range(drone_count)],
+                                    dtype=np.int64).reshape(-1, 2)
+        self.drone_pos = self.landing_pos.copy()
+        self.drone_target = self.drone_pos.copy()
+        self.drone_patrol = np.zeros(drone_count, dtype=bool)
+        self.drone_verifying = np.zeros(drone_count, dtype=bool)
+        self.drone_alert_sent = np.zeros(drone_count, dtype=bool)
+        self.drone_belief = np.full(drone_count, -1, dtype=np.int64)
+        self.drone_belief_pos = np.zeros((drone_count, 2), dtype=np.int64)
+
+        # Camera events, coalesced per robber like the AlertBus rule in
+        # SurveillanceModel.setup. Drones hold a reference to their event,
+        # whose location cameras keep updating.
+        self.merge_window = self.p.get('alertMergeWindow', 3)
+        self.suppress_steps = self.p.get('alertSuppressSteps', 0)
+        self.open_events = {}  # robber index -> open event
+        self.event_queue = []  # New events not yet assigned to a drone
+        self.suppressed = {}  # robber index -> step until which alerts are dropped
+        self.drone_event = [None] * drone_count
+        self.alerts_merged = 0
+        self.alerts_suppressed = 0
+        self.drone_signals = []  # (drone index, location) for security
+        self.security_handled = False
+
+        self.captures = 0
+        self.first_removal_step = -1  # Step at which the first robber was removed
+        self.drone_distance = np.zeros(drone_count, dtype=np.int64)  # Cells flown per drone
+        self.alarms = 0
+        self.drone_alerts = 0
+
+    def first_robber_in_range(self, centers, distance):
+        """
+        For each center, find the first living robber in row-major cell order
+        within the square range used by Grid.neighbors().
+
+        Returns:
+            np.ndarray: Robber index per center, -1 where none is in range.
+        """
+        result = np.full(len(centers), -1, dtype=np.int64)
+        alive = np.flatnonzero(self.robber_alive)
+        if len(centers) == 0 or alive.size == 0:
+            return result
+        positions = self.robber_pos[alive]
+        order_key = positions[:, 0] * self.world_size[1] + positions[:, 1]
+        no_robber = np.iinfo(np.int64).max
+        rows = max(1, CHUNK_CELLS // alive.size)
+        for start in range(0, len(centers), rows):
+            block = centers[start:start + rows]
+            in_range = np.all(np.abs(positions[None, :, :] - block[:, None, :]) <= distance, axis=2)
+            keys = np.where(in_range, order_key[None, :], no_robber)
+            first = np.argmin(keys, axis=1)
+            found = keys[np.arange(len(block)), first] != no_robber
+            result[start:start + rows] = np.where(found, alive[first], -1)
+        return result
+
+    def step_robbers(self):
+        """Moves every living robber one random step, stopping at the border."""
+        alive = np.flatnonzero(self.robber_alive)
+        moves = ROBBER_DIRECTIONS[self.nprandom.integers(len(ROBBER_DIRECTIONS), size=alive.size)]
+        self.robber_pos[alive] = np.clip(self.robber_pos[alive] + moves, 0, self.world_size - 1)
+
+    def step_cameras(self):
+        """Queues a camera alert for each camera that has a robber in range."""
+        # One draw per camera for the vision check, which is not emulated here
+        self.nprandom.random(len(self.camera_pos))
+        alive = np.flatnonzero(self.robber_alive)
+        found = self.coverage.detect(self.robber_pos[alive])
+        detected = np.full(len(found), -1, dtype=np.int64)
+        detected[found >= 0] = alive[found[found >= 0]]
+        hits = detected >= 0
+        self.camera_alerts_sent += hits
+        for robber in detected[hits]:
+            self.publish_camera_alert(robber)
+
+    def publish_camera_alert(self, robber):
+        """Opens an event for the robber, or moves its open event to the new location."""
+        if self.suppressed.get(robber, -1) > self.t:
+            self.alerts_suppressed += 1
+            return
+        location = self.robber_position(robber)
+        event = self.open_events.get(robber)
+        if event is not None and self.t - event['last_seen'] <= self.merge_window:
+            event['location'] = location
+            event['last_seen'] = self.t
+            self.alerts_merged += 1
+            return
+        event = {'robber': robber, 'location': location, 'last_seen': self.t}
+        self.open_events[robber] = event
+        self.event_queue.append(event)
+
+    def robber_position(self, robber):
+        """Current position of a robber that was just detected."""
+        return self.robber_pos[robber].copy()
+
+    def drone_sightings(self):
+        """First living robber in range of each drone, -1 where there is none."""
+        return self.first_robber_in_range(self.drone_pos, DRONE_DETECTION_RANGE)
+
+    def capture_robber(self, robber):
+        """Removes a robber caught by a drone; returns False if it was already gone."""
+        if not self.robber_alive[robber]:
+            return False
+        self.robber_alive[robber] = False
+        self.captures += 1
+        self.record_removal(self.t)
+        return True
+
+    def remove_robber_at(self, location):
+        """Removes the first living robber at a location, if there is one."""
+        at_location = np.flatnonzero(self.robber_alive & (self.robber_pos == location).all(axis=1))
+        if at_location.size:
+            self.robber_alive[at_location[0]] = False
+            self.record_removal(self.t)
+
+    def record_removal(self, step):
+        if self.first_removal_step < 0:
+            self.first_removal_step = step
+
+    def close_event(self, event):
+        if event is None:
+            return
+        if self.open_events.get(event['robber']) is event:
+            del self.open_events[event['robber']]
+        if self.suppress_steps:
+            self.suppressed[event['robber']] = self.t + self.suppress_steps
+
+    def send_alert_to_security(self, drone):
+        if not self.drone_alert_sent[drone]:
+            self.drone_signals.append((drone, tuple(self.drone_pos[drone])))
+            self.drone_alert_sent[drone] = True
+            self.drone_alerts += 1
+
+    def execute_plan(self, drone):
+        """Moves one cell along the plan, or alerts security if it is complete."""
+        delta = self.drone_target[drone] - self.drone_pos[drone]
+        if delta.any():
+            self.drone_pos[drone] += np.sign(delta)
+            self.drone_distance[drone] += 1
+        else:
+            self.send_alert_to_security(drone)
+
+    def dispatch_alerts(self):
+        """Assigns queued events to idle drones, like SurveillanceModel.dispatch_alerts."""
+        if not self.event_queue:
+            return
+        idle = np.flatnonzero(~self.drone_alert_sent & ~self.drone_verifying)
+        pairs = assign_alerts(self.drone_pos[idle], [event['location'] for event in self.event_queue],
+                              self.p.get('dispatchExactMax', 64))
+        for drone, alert in pairs:
+            drone = idle[drone]
+            event = self.event_queue[alert]
+            if self.drone_event[drone] is not None and self.drone_event[drone] is not event:
+                self.close_event(self.drone_event[drone])
+            self.drone_event[drone] = event
+            self.drone_verifying[drone] = True
+        assigned = {alert for _, alert in pairs}
+        self.event_queue = [event for i, event in enumerate(self.event_queue) if i not in assigned]
+
+    def step_drones(self):
+        """Runs the DroneAgent BDI cycle for every drone, in agent order."""
+        seen = self.drone_sightings()
+        for drone in range(len(self.drone_pos)):
+            if self.drone_alert_sent[drone]:
+                continue
+            self.drone_patrol[drone] = True
+
+            if self.drone_verifying[drone]:
+                # Follow the event's latest location
+                self.drone_target[drone] = self.drone_event[drone]['location']
+                self.execute_plan(drone)
+                continue
+
+            # Direct detection of robbers
+            robber = seen[drone]
+            if robber >= 0:
+                self.drone_belief[drone] = robber
+                self.drone_belief_pos[drone] = self.robber_position(robber)
+                self.send_alert_to_security(drone)
+                self.drone_target[drone] = self.drone_belief_pos[drone]
+                self.execute_plan(drone)
+                continue
+
+            # Capture the robber the drone believes is here
+            believed = self.drone_belief[drone]
+            if believed >= 0 and (self.drone_pos[drone] == self.drone_belief_pos[drone]).all():
+                if self.capture_robber(believed):
+                    seen = self.drone_sightings()
+                self.send_alert_to_security(drone)
+                self.drone_belief[drone] = -1
+                self.drone_target[drone] = self.landing_pos[drone]
+                self.execute_plan(drone)
+                continue
+
+            # Random patrol, then head back to the landing station
+            if not (self.drone_target[drone] - self.drone_pos[drone]).any() and believed < 0:
+                step = DRONE_DIRECTIONS[self.nprandom.integers(len(DRONE_DIRECTIONS))]
+                new_position = self.drone_pos[drone] + step
+                if ((0 <= new_position) & (new_position < self.world_size)).all():
+                    self.drone_pos[drone] = new_position
+                    self.drone_distance[drone] += 1
+                self.drone_target[drone] = self.drone_pos[drone]
+                self.execute_plan(drone)
+            if not (self.drone_target[drone] - self.drone_pos[drone]).any() and believed < 0:
+                if (self.drone_pos[drone] != self.landing_pos[drone]).any():
+                    self.drone_target[drone] = self.landing_pos[drone]
+                else:
+                    self.drone_patrol[drone] = False
+
+    def step_security(self):
+        """Resolves queued drone signals, removing a robber at each location."""
+        if self.security_handled:
+            return
+        for drone, location in self.drone_signals:
+            self.remove_robber_at(location)
+            self.alarms += 1
+            # Same as DroneAgent.receive_command("alert_resolved")
+            self.close_event(self.drone_event[drone])
+            self.drone_event[drone] = None
+            self.drone_alert_sent[drone] = False
+            self.drone_verifying[drone] = False
+            self.drone_target[drone] = self.drone_pos[drone]
+            self.drone_patrol[drone] = True
+            self.security_handled = True
+        self.drone_signals = []
+
+    def step(self):
+        """Run the simulation for one step."""
+        self.t += 1
+        self.step_robbers()
+        self.step_cameras()
+        self.dispatch_alerts()
+        self.step_drones()
+        self.step_security()
+
+    def run(self, steps=None, seed=None):
+        """Runs the model for `steps` (default `p['steps']`) and returns its results."""
+        self.setup(seed)
+        self.running = True
+        steps = self.p['steps'] if steps is None else steps
+        while self.running and self.t < steps:
+            self.step()
+        self.running = False
+        return self.results()
+
+    def robber_positions(self):
+        """Positions of the remaining robbers, in robber order."""
+        return self.robber_pos[self.robber_alive]
+
+    def results(self):
+        """
+        Summary of the run, comparable with an agentpy SurveillanceModel.
+
+        first_removal_step is -1 if no robber was removed.
+        """
+        robber_positions = self.robber_positions()
+        return {
+            'steps': self.t,
+            'robbers_remaining': int(self.robber_alive.sum()),
+            'robbers_captured': self.captures,
+            'camera_alerts': int(self.camera_alerts_sent.sum()),
+            'alerts_merged': self.alerts_merged,
+            'alerts_suppressed': self.alerts_suppressed,
+            'drone_alerts': self.drone_alerts,
+            'alarms': self.alarms,
+            'first_removal_step': self.first_removal_step,
+            'drone_distance': int(self.drone_distance.sum()),
+            'drone_positions': [tuple(p) for p in self.drone_pos.tolist()],
+            'robber_positions': [tuple(p) for p in robber_positions.tolist()],
+        }
+
+
+if __name__ == "__main__":
+    model = VectorizedSurveillanceModel(parameters)
+    print(model.run())